@@ -1,12 +1,17 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 
+from config.images import loaded_file_name, variant_file_names
+
 
 class User(AbstractUser):
     email = models.EmailField(unique=True)
     first_name = models.CharField(max_length=30, blank=True)
     last_name = models.CharField(max_length=50, blank=True)
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Один клиент Stripe на пользователя, переиспользуется всеми платежами
+    stripe_customer_id = models.CharField(max_length=255, blank=True, null=True, unique=True)
     bio = models.TextField(max_length = 500, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -21,8 +26,31 @@ class User(AbstractUser):
         verbose_name_plural = 'Users'
 
 
+    # Пишутся только фоновыми задачами и сервисами, обычный save() их не трогает
+    DERIVED_FIELDS = ('avatar_variants', 'stripe_customer_id')
+
     def __str__(self):
         return self.email
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._previous_avatar = loaded_file_name(self, 'avatar') if self.pk else ''
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            from apps.main.models import fields_to_update_without
+
+            kwargs['update_fields'] = fields_to_update_without(self, self.DERIVED_FIELDS)
+        super().save(*args, **kwargs)
+
+        avatar = loaded_file_name(self, 'avatar')
+        if avatar is not None and avatar != self._previous_avatar:
+            from .tasks import generate_avatar_variants
+
+            stale_files = variant_file_names(self.__dict__.get('avatar_variants'))
+            user_id = self.pk
+            transaction.on_commit(lambda: generate_avatar_variants.delay(user_id, stale_files))
+            self._previous_avatar = avatar
     
     @property 
     def full_name(self):
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
 from .models import User
+from config.images import image_srcset
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(
@@ -60,6 +61,7 @@ class UserLoginSerializer(serializers.Serializer):
 
 class UserProfileSerializer(serializers.ModelSerializer):
     full_name = serializers.ReadOnlyField()
+    avatar_srcset = serializers.SerializerMethodField()
     posts_count = serializers.SerializerMethodField()
     comments_count = serializers.SerializerMethodField()
 
@@ -67,11 +69,14 @@ class UserProfileSerializer(serializers.ModelSerializer):
         model = User
         fields = (
             'id', 'username', 'email', 'first_name', 'last_name', 
-            'full_name', 'avatar', 'bio', 'created_at', 'updated_at',
+            'full_name', 'avatar', 'avatar_srcset', 'bio', 'created_at', 'updated_at',
             'posts_count', 'comments_count'
         )
         read_only_fields = ('id', 'created_at', 'updated_at')
 
+    def get_avatar_srcset(self, obj):
+        return image_srcset(obj.avatar_variants, self.context.get('request'))
+
     def get_posts_count(self, obj):
         try:
             return obj.posts.count()
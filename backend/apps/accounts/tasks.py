@@ -0,0 +1,34 @@
+import logging
+
+from celery import shared_task
+from django.contrib.auth import get_user_model
+from PIL import Image
+
+from config.images import build_image_variants, delete_image_variants, variant_file_names
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def generate_avatar_variants(user_id, stale_files=()):
+    """Строит производные аватара пользователя и удаляет файлы прежних"""
+    User = get_user_model()
+    user = User.objects.filter(pk=user_id).only('id', 'avatar').first()
+    variants = {}
+    if user is not None and user.avatar:
+        name = user.avatar.name
+        try:
+            variants = build_image_variants(name)
+        except (OSError, Image.DecompressionBombError) as e:
+            logger.warning(f"Failed to build avatar variants for user {user_id}: {e}")
+            return {'user_id': user_id, 'variants': 0}
+
+        if not User.objects.filter(pk=user_id, avatar=name).update(avatar_variants=variants):
+            delete_image_variants(variant_file_names(variants))
+            variants = {}
+    elif user is not None:
+        User.objects.filter(pk=user_id).update(avatar_variants={})
+
+    delete_image_variants(stale_files)
+
+    return {'user_id': user_id, 'variants': len(variants)}
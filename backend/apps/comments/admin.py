@@ -10,7 +10,7 @@ class CommentAdmin(admin.ModelAdmin):
         )
     list_filter = ('created_at', 'updated_at', 'is_active')
     search_fields = ('content', 'post__title', 'author__username')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('created_at', 'updated_at', 'replies_count')
     raw_id_fields = ('author', 'post', 'parent')
     list_editable = ('is_active',)
     
@@ -19,7 +19,7 @@ class CommentAdmin(admin.ModelAdmin):
             'fields': ('post', 'author', 'parent', 'content')
         }),
         ('Status', {
-            'fields': ('is_active',)
+            'fields': ('is_active', 'replies_count')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
@@ -49,11 +49,11 @@ class CommentAdmin(admin.ModelAdmin):
     actions = ['activate_comments', 'deactivate_comments']
 
     def activate_comments(self, request, queryset):
-        updated = queryset.update(is_active=True)
+        updated = queryset.set_active(True)
         self.message_user(request, f'{updated} comments were marked as active.')
     activate_comments.short_description = 'Mark selected comments as active'
 
     def deactivate_comments(self, request, queryset):
-        updated = queryset.update(is_active=False)
+        updated = queryset.set_active(False)
         self.message_user(request, f'{updated} comments were marked as inactive.')
     deactivate_comments.short_description = 'Mark selected comments as inactive'
\ No newline at end of file
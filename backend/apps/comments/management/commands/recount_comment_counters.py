@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.main.models import Post
+from apps.comments.models import Comment
+
+
+class Command(BaseCommand):
+
+    help = 'Recalculate stored comments_count on posts and replies_count on comments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Number of rows recalculated per transaction'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        # Пересчитываем пачками по id, чтобы не держать долгую транзакцию на всю таблицу
+        posts = self._recount(Post, 'post_ids', batch_size)
+        self.stdout.write(f'Posts recalculated: {posts}')
+
+        comments = self._recount(Comment, 'comment_ids', batch_size)
+        self.stdout.write(f'Comments recalculated: {comments}')
+
+        self.stdout.write(self.style.SUCCESS('Comment counters are up to date'))
+
+    def _recount(self, model, ids_argument, batch_size):
+        total = 0
+        last_id = 0
+        while True:
+            ids = list(
+                model.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                return total
+
+            counters = {'post_ids': set(), 'comment_ids': set(), ids_argument: ids}
+            with transaction.atomic():
+                Comment.objects.recount_counters(**counters)
+
+            total += len(ids)
+            last_id = ids[-1]
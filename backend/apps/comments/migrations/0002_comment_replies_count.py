@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:26
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Post = apps.get_model('main', 'Post')
+    Comment = apps.get_model('comments', 'Comment')
+
+    active_comments = Comment.objects.filter(
+        post=OuterRef('pk'), is_active=True
+    ).order_by().values('post').annotate(total=Count('pk')).values('total')
+    Post.objects.update(comments_count=Coalesce(Subquery(active_comments), 0))
+
+    active_replies = Comment.objects.filter(
+        parent=OuterRef('pk'), is_active=True
+    ).order_by().values('parent').annotate(total=Count('pk')).values('total')
+    Comment.objects.update(replies_count=Coalesce(Subquery(active_replies), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0001_initial'),
+        ('main', '0002_post_comments_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='replies_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0003_comment_search_vector'),
+        ('main', '0008_post_partial_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='comments_post_id_8fd787_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='comments_parent__b79743_idx',
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['post', '-created_at', '-id'], name='comments_active_post_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_active', True), ('parent__isnull', True)), fields=['post', '-created_at', '-id'], name='comments_active_root_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['parent', 'created_at', 'id'], name='comments_active_reply_idx'),
+        ),
+    ]
@@ -1,16 +1,138 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.utils import timezone
+
+from apps.main.models import SEARCH_CONFIG, Post, fields_to_update_without
+from apps.main.services import TrendingService
+
+
+class CommentQuerySet(models.QuerySet):
+    def set_active(self, is_active):
+        """
+        Массово активирует/деактивирует комментарии и пересчитывает
+        счетчики затронутых постов и родительских комментариев.
+        """
+        with transaction.atomic():
+            changed = list(
+                self.exclude(is_active=is_active).values_list('id', 'post_id', 'parent_id')
+            )
+            if not changed:
+                return 0
+
+            updated = Comment.objects.filter(
+                id__in=[comment_id for comment_id, _, _ in changed]
+            ).update(is_active=is_active, updated_at=timezone.now())
+
+            Comment.objects.recount_counters(
+                post_ids={post_id for _, post_id, _ in changed},
+                comment_ids={parent_id for _, _, parent_id in changed if parent_id},
+            )
+        return updated
+
+    def recount_counters(self, post_ids=None, comment_ids=None):
+        """
+        Пересчитывает comments_count у постов и replies_count у комментариев.
+        None означает пересчет по всей таблице, пустой набор - пропуск.
+        """
+        if post_ids is None or post_ids:
+            active_comments = Comment.objects.filter(
+                post=OuterRef('pk'), is_active=True
+            ).order_by().values('post').annotate(total=Count('pk')).values('total')
+
+            posts = Post.objects.all() if post_ids is None else Post.objects.filter(id__in=post_ids)
+            posts.update(
+                comments_count=Coalesce(Subquery(active_comments), 0),
+                comments_updated_at=timezone.now()
+            )
+            TrendingService.recompute(post_ids)
+
+        if comment_ids is None or comment_ids:
+            active_replies = Comment.objects.filter(
+                parent=OuterRef('pk'), is_active=True
+            ).order_by().values('parent').annotate(total=Count('pk')).values('total')
+
+            comments = Comment.objects.all() if comment_ids is None else Comment.objects.filter(id__in=comment_ids)
+            comments.update(replies_count=Coalesce(Subquery(active_replies), 0))
+
+
+    def thread(self, post_id, root_id=None, depth=5, breadth=20, roots=20):
+        """
+        Окно дерева активных комментариев одним запросом (рекурсивный CTE).
+        Берутся roots верхних комментариев поста (новые первыми) или один
+        комментарий root_id, и у каждого узла не больше breadth ответов
+        (старые первыми) на глубину до depth уровней.
+        Вложенность собирается в Python, см. build_comment_tree.
+        """
+        table = Comment._meta.db_table
+        if root_id is None:
+            start = (
+                f'SELECT id, 0 AS depth FROM {table} '
+                'WHERE post_id = %s AND parent_id IS NULL AND is_active '
+                'ORDER BY created_at DESC, id DESC LIMIT %s'
+            )
+            start_params = [post_id, roots]
+        else:
+            start = (
+                f'SELECT id, 0 AS depth FROM {table} '
+                'WHERE post_id = %s AND id = %s AND is_active'
+            )
+            start_params = [post_id, root_id]
+
+        # LATERAL ограничивает число ответов на каждом узле, а не на всем уровне
+        window = (
+            f'WITH RECURSIVE tree(id, depth) AS ('
+            f'({start}) '
+            'UNION ALL '
+            'SELECT child.id, tree.depth + 1 FROM tree '
+            'CROSS JOIN LATERAL ('
+            f'SELECT id FROM {table} '
+            'WHERE parent_id = tree.id AND is_active '
+            'ORDER BY created_at, id LIMIT %s'
+            ') AS child '
+            'WHERE tree.depth < %s'
+            ') SELECT id FROM tree'
+        )
+        return self.filter(id__in=RawSQL(window, [*start_params, breadth, depth]))
+
+
+class CommentManager(models.Manager.from_queryset(CommentQuerySet)):
+    def get_queryset(self):
+        # tsvector нужен только в SQL, в Python его не загружаем
+        return super().get_queryset().defer('search_vector')
+
+
+def build_comment_tree(comments):
+    """
+    Раскладывает плоский список комментариев в дерево: каждому узлу
+    проставляется tree_replies, возвращаются узлы без родителя в окне
+    """
+    nodes = {comment.id: comment for comment in comments}
+    roots = []
+    for comment in comments:
+        comment.tree_replies = []
+    for comment in comments:
+        parent = nodes.get(comment.parent_id)
+        if parent is None:
+            roots.append(comment)
+        else:
+            parent.tree_replies.append(comment)
+    return roots
 
 
 class Comment(models.Model):
     post = models.ForeignKey(
-        'main.Post', 
-        on_delete=models.CASCADE, 
+        'main.Post',
+        on_delete=models.CASCADE,
         related_name='comments'
         )
-    author = models.ForeignKey( 
-        settings.AUTH_USER_MODEL, 
-        on_delete=models.CASCADE, 
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
         related_name='comments'
         )
     parent = models.ForeignKey(
@@ -24,6 +146,16 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    replies_count = models.PositiveIntegerField(default=0, editable=False)
+    search_vector = models.GeneratedField(
+        expression=SearchVector('content', config=SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    objects = CommentManager()
+
+    COUNTER_FIELDS = ('replies_count',)
 
     class Meta:
         db_table = 'comments'
@@ -31,18 +163,81 @@ class Comment(models.Model):
         verbose_name_plural = 'Comments'
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['post', '-created_at']),
-            models.Index(fields=['parent', '-created_at']),
+            # Мои комментарии: включая удаленные
             models.Index(fields=['author', '-created_at']),
+            # Публичные выборки читают только активные комментарии
+            models.Index(
+                fields=['post', '-created_at', '-id'],
+                name='comments_active_post_idx',
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=['post', '-created_at', '-id'],
+                name='comments_active_root_idx',
+                condition=models.Q(is_active=True, parent__isnull=True),
+            ),
+            models.Index(
+                fields=['parent', 'created_at', 'id'],
+                name='comments_active_reply_idx',
+                condition=models.Q(is_active=True),
+            ),
+            GinIndex(fields=['search_vector']),
         ]
 
     def __str__(self):
         return f'Comment by {self.author.username} on {self.post.title}'
 
-    @property
-    def replies_count(self):
-        return self.replies.filter(is_active=True).count()
-    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Берем из __dict__, чтобы не догружать отложенное поле
+        self._previous_is_active = self.__dict__.get('is_active') if self.pk else None
+
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        if not created and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = fields_to_update_without(self, self.COUNTER_FIELDS)
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            if created:
+                delta = 1 if self.is_active else 0
+            elif self._previous_is_active is not None and self._previous_is_active != self.is_active:
+                delta = 1 if self.is_active else -1
+            else:
+                delta = 0
+
+            # Правка текста тоже меняет комментарии поста для ETag
+            self._apply_counter_delta(delta)
+
+        self._previous_is_active = self.is_active
+
+    def deactivate(self):
+        """Мягкое удаление комментария без гонки при повторных запросах"""
+        with transaction.atomic():
+            updated = Comment.objects.filter(pk=self.pk, is_active=True).update(
+                is_active=False, updated_at=timezone.now()
+            )
+            if updated:
+                self._apply_counter_delta(-1)
+
+        self.is_active = False
+        self._previous_is_active = False
+
+    def _apply_counter_delta(self, delta):
+        Post.objects.filter(pk=self.post_id).update(
+            comments_count=F('comments_count') + delta,
+            comments_updated_at=timezone.now()
+        )
+        if not delta:
+            return
+        TrendingService.mark_dirty([self.post_id])
+        if self.parent_id:
+            Comment.objects.filter(pk=self.parent_id).update(
+                replies_count=F('replies_count') + delta
+            )
+
     @property
     def is_reply(self):
-        return self.parent is not None
\ No newline at end of file
+        # parent_id, чтобы не загружать родителя отдельным запросом
+        return self.parent_id is not None
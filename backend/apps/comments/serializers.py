@@ -1,6 +1,7 @@
 from .models import Comment
 from rest_framework import serializers
 from apps.main.models import Post
+from config.images import image_srcset
 
 class CommentSerializer(serializers.ModelSerializer):
     author_info = serializers.SerializerMethodField()
@@ -21,9 +22,36 @@ class CommentSerializer(serializers.ModelSerializer):
             'id': obj.author.id,
             'username': obj.author.username,
             'full_name': obj.author.full_name,
-            'avatar': obj.author.avatar.url if obj.author.avatar else None
+            'avatar': obj.author.avatar.url if obj.author.avatar else None,
+            'avatar_srcset': image_srcset(obj.author.avatar_variants, self.context.get('request'))
         }
     
+class CommentThreadSerializer(CommentSerializer):
+    """Комментарий с первыми ответами (inline_replies) и ссылкой на остальные"""
+    replies = serializers.SerializerMethodField()
+    replies_next = serializers.ReadOnlyField()
+
+    class Meta(CommentSerializer.Meta):
+        fields = CommentSerializer.Meta.fields + ['replies', 'replies_next']
+
+    def get_replies(self, obj):
+        return CommentSerializer(obj.inline_replies, many=True, context=self.context).data
+
+class CommentTreeSerializer(CommentSerializer):
+    """Узел дерева: ответы уже разложены в tree_replies (см. build_comment_tree)"""
+    replies = serializers.SerializerMethodField()
+    has_more_replies = serializers.SerializerMethodField()
+
+    class Meta(CommentSerializer.Meta):
+        fields = CommentSerializer.Meta.fields + ['replies', 'has_more_replies']
+
+    def get_replies(self, obj):
+        return CommentTreeSerializer(obj.tree_replies, many=True, context=self.context).data
+
+    def get_has_more_replies(self, obj):
+        # Ответы за пределами окна глубины/ширины догружаются отдельным запросом
+        return obj.replies_count > len(obj.tree_replies)
+
 class CommentCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from apps.main.models import Post
+from .models import Comment
+
+# Поля автора, которые выводятся в author_info комментария
+AUTHOR_INFO_FIELDS = {'username', 'first_name', 'last_name', 'avatar'}
+
+
+@receiver(post_delete, sender=Comment)
+def touch_post_on_comment_delete(sender, instance, **kwargs):
+    """Жесткое удаление комментария тоже меняет ETag комментариев поста"""
+    Post.objects.filter(pk=instance.post_id).update(comments_updated_at=timezone.now())
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def touch_posts_on_author_change(sender, instance, created, update_fields=None, **kwargs):
+    """Смена имени или аватара автора меняет ETag комментариев постов, где он писал"""
+    if created or (update_fields is not None and not AUTHOR_INFO_FIELDS & set(update_fields)):
+        return
+    Post.objects.filter(
+        id__in=Comment.objects.filter(author=instance).values('post_id')
+    ).update(comments_updated_at=timezone.now())
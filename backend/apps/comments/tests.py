@@ -1,3 +1,97 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from apps.main.models import Post
+from apps.main.tests import IndexUsageTestCase
+from .models import Comment
+
+
+class CommentIndexTests(IndexUsageTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = get_user_model().objects.create_user(
+            username='author', email='author@example.com', password='password'
+        )
+        cls.post = Post.objects.create(title='Post', content='Text', author=author)
+        cls.root = Comment.objects.create(post=cls.post, author=author, content='Root')
+        Comment.objects.create(post=cls.post, author=author, content='Reply', parent=cls.root)
+        Comment.objects.create(post=cls.post, author=author, content='Deleted', is_active=False)
+
+    def test_post_comments_use_partial_index(self):
+        comments = Comment.objects.filter(
+            post=self.post, is_active=True
+        ).order_by('-created_at', '-id')[:20]
+        self.assertUsesIndex(comments, 'comments_active_post_idx')
+
+    def test_top_level_comments_use_partial_index(self):
+        comments = Comment.objects.filter(
+            post=self.post, parent=None, is_active=True
+        ).order_by('-created_at', '-id')[:20]
+        self.assertUsesIndex(comments, 'comments_active_root_idx')
+
+    def test_replies_use_partial_index(self):
+        replies = Comment.objects.filter(
+            parent=self.root, is_active=True
+        ).order_by('created_at', 'id')[:20]
+        self.assertUsesIndex(replies, 'comments_active_reply_idx')
+
+    def test_inline_replies_use_partial_index(self):
+        replies = Comment.objects.filter(
+            parent_id__in=[self.root.id], is_active=True
+        ).annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=F('parent_id'),
+                order_by=[F('created_at').asc(), F('id').asc()]
+            )
+        ).filter(position__lte=3)
+        self.assertUsesIndex(replies, 'comments_active_reply_idx')
+
+    def test_comment_tree_uses_partial_index(self):
+        comments = Comment.objects.thread(self.post.id)
+        self.assertUsesIndex(comments, 'comments_active_reply_idx')
+
+
+class CommentsConditionalTests(TestCase):
+    """ETag комментариев поста считается по состоянию поста и меняется при записи комментариев"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = get_user_model().objects.create_user(
+            username='author', email='author@example.com', password='password'
+        )
+        cls.post = Post.objects.create(title='Post', content='Text', author=cls.author)
+        cls.comment = Comment.objects.create(post=cls.post, author=cls.author, content='Root')
+
+    def assertChangesETag(self, change):
+        url = reverse('post-comments', args=[self.post.id])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        change()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_not_modified_reads_only_the_post(self):
+        url = reverse('post-comments', args=[self.post.id])
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), 1, selects)
+
+    def test_comment_edit_changes_etag(self):
+        def edit():
+            self.comment.content = 'Edited'
+            self.comment.save()
+        self.assertChangesETag(edit)
+
+    def test_author_rename_changes_etag(self):
+        def rename():
+            self.author.first_name = 'Renamed'
+            self.author.save()
+        self.assertChangesETag(rename)
@@ -8,6 +8,7 @@ urlpatterns = [
     path('<int:pk>/', views.CommentDetailView.as_view(), name='comment-detail'),
     path('my-comments/', views.MyCommentsView.as_view(), name='my-comments'),
     path('post/<int:post_id>/', views.post_comments, name='post-comments'),
+    path('post/<int:post_id>/tree/', views.post_comment_tree, name='post-comment-tree'),
     path('<int:comment_id>/replies/', views.comment_replies, name='comment-replies'),
 ]
 
@@ -1,24 +1,34 @@
-from rest_framework import generics, permissions, filters
+from rest_framework import generics, permissions, filters, status
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from rest_framework.utils.urls import replace_query_param
 
-from .models import Comment
+from .models import Comment, build_comment_tree
 from .serializers import (
     CommentSerializer, 
+    CommentThreadSerializer,
+    CommentTreeSerializer,
     CommentCreateSerializer, 
     CommentUpdateSerializer, 
     CommentDetailSerializer
 )
 from .permissions import IsAuthorOrReadOnly
 from apps.main.models import Post
+from apps.main.pagination import KeysetPagination, OptionalKeysetPagination
+from apps.main.filters import FullTextSearchFilter
+from apps.main.conditional import ConditionalRetrieveMixin, latest, make_etag, not_modified_response, set_conditional_headers
 
 class CommentListCreateView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = OptionalKeysetPagination
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
     filterset_fields = ['post', 'author', 'parent']
-    search_fields = ['content']
     ordering_fields = ['created_at', 'updated_at']
     ordering = ['-created_at']
     
@@ -35,10 +45,14 @@ class CommentListCreateView(generics.ListCreateAPIView):
         context = super().get_serializer_context()
         context['request'] = self.request  # Передаём request в сериализатор
         return context
-class CommentDetailView(generics.RetrieveUpdateDestroyAPIView):
+class CommentDetailView(ConditionalRetrieveMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Comment.objects.filter(is_active=True).select_related('author', 'post')
     serializer_class = CommentDetailSerializer
     permission_classes = [IsAuthorOrReadOnly]
+
+    def get_conditional_validators(self, instance):
+        # Комментарий вместе с ответами, как в CommentDetailSerializer
+        return comments_validators(instance.post)
     
     def get_serializer_class(self):
         if self.request.method in ['PUT', 'PATCH']:  
@@ -46,16 +60,15 @@ class CommentDetailView(generics.RetrieveUpdateDestroyAPIView):
         return CommentDetailSerializer
     
     def perform_destroy(self, instance):
-        instance.is_active = False
-        instance.save()
+        instance.deactivate()
 
 
 class MyCommentsView(generics.ListAPIView):
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, filters.SearchFilter]
+    pagination_class = OptionalKeysetPagination
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, FullTextSearchFilter]
     filterset_fields = ['post', 'parent', 'is_active']
-    search_fields = ['content']
     ordering_fields = ['created_at', 'updated_at']
     ordering = ['-created_at']
 
@@ -64,43 +77,209 @@ class MyCommentsView(generics.ListAPIView):
             'post', 'parent'
         )
     
+def comments_validators(post):
+    """
+    ETag и Last-Modified для комментариев поста по денормализованному
+    состоянию поста, без агрегатов по комментариям: comments_updated_at
+    сдвигается при любой записи комментария и смене профиля автора
+    """
+    last_modified = latest(post.updated_at, post.comments_updated_at)
+    return make_etag(post.pk, post.comments_count, last_modified), last_modified
+
+
+# Порядок верхних комментариев и ответов для keyset пагинации
+COMMENTS_ORDERING = ('-created_at', '-id')
+REPLIES_ORDERING = ('created_at', 'id')
+# Сколько первых ответов встраивать в каждый комментарий: (по умолчанию, максимум)
+INLINE_REPLIES = (3, 20)
+
+
+def get_inline_replies_limit(request):
+    default, maximum = INLINE_REPLIES
+    value = request.query_params.get('replies')
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValidationError({'replies': 'Must be an integer.'})
+    if not 0 <= value <= maximum:
+        raise ValidationError({'replies': f'Must be between 0 and {maximum}.'})
+    return value
+
+
+def replies_cursor_link(request, comment, after=None):
+    """Ссылка на продолжение ответов комментария после ответа after"""
+    url = request.build_absolute_uri(reverse('comment-replies', args=[comment.id]))
+    if after is None:
+        return url
+    cursor = KeysetPagination.encode_cursor(0, KeysetPagination.row_values(after, REPLIES_ORDERING))
+    return replace_query_param(url, KeysetPagination.cursor_query_param, cursor)
+
+
+def attach_inline_replies(request, comments, limit):
+    """
+    Встраивает в каждый комментарий первые limit ответов одним запросом
+    (ROW_NUMBER() по parent_id) и ссылку на остальные ответы
+    """
+    inline = {comment.id: [] for comment in comments}
+    if limit and inline:
+        replies = Comment.objects.filter(
+            parent_id__in=list(inline), is_active=True
+        ).select_related('author').annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=F('parent_id'),
+                order_by=[F(field).asc() for field in REPLIES_ORDERING]
+            )
+        ).filter(position__lte=limit).order_by('parent_id', *REPLIES_ORDERING)
+        for reply in replies:
+            inline[reply.parent_id].append(reply)
+
+    for comment in comments:
+        comment.inline_replies = inline[comment.id]
+        comment.replies_next = None
+        if comment.replies_count > len(comment.inline_replies):
+            last = comment.inline_replies[-1] if comment.inline_replies else None
+            comment.replies_next = replies_cursor_link(request, comment, after=last)
+
+
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def post_comments(request, post_id):
+    """
+    Верхние комментарии поста с курсорной пагинацией (новые первыми).
+    В каждый встроены первые ?replies= ответов и ссылка replies_next на остальные
+    """
     post = get_object_or_404(Post, id=post_id, status='published')
+    inline_limit = get_inline_replies_limit(request)
+
+    etag, last_modified = comments_validators(post)
+    etag = make_etag(request.get_full_path(), etag)
+    response = not_modified_response(request, etag, last_modified)
+    if response is not None:
+        return response
 
     comments = Comment.objects.filter(
         post=post,
         parent=None,
         is_active=True
-    ).select_related('author').prefetch_related(
-        'replies__author'
-        ).order_by('-created_at')
-    
-    serializer = CommentSerializer(comments, many=True, context = {'request': request})
-    return Response({
+    ).select_related('author')
+
+    paginator = KeysetPagination(ordering=COMMENTS_ORDERING)
+    page = paginator.paginate_queryset(comments, request)
+    attach_inline_replies(request, page, inline_limit)
+
+    serializer = CommentThreadSerializer(page, many=True, context={'request': request})
+    response = Response({
         'post': {
             'id': post.id, 
             'title': post.title,
             'slug': post.slug
         },
         'comments': serializer.data,
-        'comments_count': post.comments.filter(is_active=True).count()
+        'comments_count': post.comments_count,
+        'next': paginator.get_next_link(),
     })
+    return set_conditional_headers(response, etag, last_modified)
 
 
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def comment_replies(request, comment_id):
-    parent_comment = get_object_or_404(Comment, id=comment_id, is_active=True)
+    """Ответы на комментарий с курсорной пагинацией (старые первыми)"""
+    parent_comment = get_object_or_404(
+        Comment.objects.select_related('author', 'post'), id=comment_id, is_active=True
+    )
+
+    etag, last_modified = comments_validators(parent_comment.post)
+    etag = make_etag(request.get_full_path(), etag)
+    response = not_modified_response(request, etag, last_modified)
+    if response is not None:
+        return response
+
     replies = Comment.objects.filter(
         parent=parent_comment, 
         is_active=True,
-    ).select_related('author').order_by('created_at')
+    ).select_related('author')
 
-    serializer = CommentSerializer(replies, many=True, context={'request': request})
-    return Response({
+    paginator = KeysetPagination(ordering=REPLIES_ORDERING)
+    page = paginator.paginate_queryset(replies, request)
+
+    serializer = CommentSerializer(page, many=True, context={'request': request})
+    response = Response({
         'parent_comment': CommentSerializer(parent_comment, context={'request': request}).data,
         'replies': serializer.data,
-        'replies_count': replies.count()
-    })
\ No newline at end of file
+        'replies_count': parent_comment.replies_count,
+        'next': paginator.get_next_link(),
+    })
+    return set_conditional_headers(response, etag, last_modified)
+
+
+# Границы окна дерева: (значение по умолчанию, максимум)
+TREE_LIMITS = {
+    'depth': (5, 10),
+    'breadth': (20, 100),
+    'roots': (20, 100),
+}
+
+
+def get_tree_limit(request, name):
+    default, maximum = TREE_LIMITS[name]
+    value = request.query_params.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValidationError({name: 'Must be an integer.'})
+    if not 0 < value <= maximum:
+        raise ValidationError({name: f'Must be between 1 and {maximum}.'})
+    return value
+
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def post_comment_tree(request, post_id):
+    """
+    Дерево комментариев поста одним запросом.
+    ?depth= - уровней ответов, ?breadth= - ответов на узел, ?roots= - верхних комментариев,
+    ?root=<id> - поддерево одного комментария (например, чтобы догрузить ветку)
+    """
+    post = get_object_or_404(Post, id=post_id, status='published')
+    root_id = request.query_params.get('root')
+    if root_id is not None and not root_id.isdigit():
+        raise ValidationError({'root': 'Must be a comment id.'})
+
+    limits = {name: get_tree_limit(request, name) for name in TREE_LIMITS}
+
+    etag, last_modified = comments_validators(post)
+    etag = make_etag(request.get_full_path(), etag)
+    response = not_modified_response(request, etag, last_modified)
+    if response is not None:
+        return response
+
+    comments = list(
+        Comment.objects.thread(
+            post.id, root_id=int(root_id) if root_id else None, **limits
+        ).select_related('author').order_by('created_at', 'id')
+    )
+    if root_id is not None and not comments:
+        return Response({'error': 'Comment not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    roots = build_comment_tree(comments)
+    if root_id is None:
+        # Верхние комментарии - новые первыми, ответы - по порядку
+        roots.reverse()
+
+    response = Response({
+        'post': {
+            'id': post.id,
+            'title': post.title,
+            'slug': post.slug
+        },
+        'comments': CommentTreeSerializer(roots, many=True, context={'request': request}).data,
+        'comments_count': post.comments_count,
+        'limits': limits,
+    })
+    return set_conditional_headers(response, etag, last_modified)
@@ -25,7 +25,7 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('status', 'category', 'created_at', 'updated_at')
     search_fields = ('title', 'content', 'author__username')
     prepopulated_fields = {'slug': ('title',)}
-    readonly_fields = ('created_at', 'updated_at', 'views_count')
+    readonly_fields = ('created_at', 'updated_at', 'views_count', 'comments_count')
     raw_id_fields = ('author',)
     
     fieldsets = (
@@ -36,14 +36,10 @@ class PostAdmin(admin.ModelAdmin):
             'fields': ('category', 'author', 'status')
         }),
         ('Statistics', {
-            'fields': ('views_count', 'created_at', 'updated_at'),
+            'fields': ('views_count', 'comments_count', 'created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
     )
 
-    def comments_count(self, obj):
-        return obj.comments.count()
-    comments_count.short_description = 'Comments'
-
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('author', 'category')
\ No newline at end of file
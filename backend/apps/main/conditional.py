@@ -0,0 +1,67 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+def make_etag(*parts):
+    """Сильный ETag из значений, от которых зависит представление"""
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def latest(*timestamps):
+    """Самая поздняя из непустых дат (для Last-Modified)"""
+    timestamps = [timestamp for timestamp in timestamps if timestamp is not None]
+    return max(timestamps) if timestamps else None
+
+
+def set_conditional_headers(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def not_modified_response(request, etag, last_modified=None):
+    """
+    Ответ 304 (или 412 для If-Match), если у клиента актуальная версия,
+    иначе None и view сериализует данные как обычно
+    """
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is not None:
+        set_conditional_headers(response, etag, last_modified)
+    return response
+
+
+class ConditionalRetrieveMixin:
+    """
+    Условный GET для RetrieveAPIView: ETag и Last-Modified считаются
+    по объекту в get_conditional_validators(instance) до сериализации
+    """
+
+    def get_conditional_validators(self, instance):
+        """
+        Возвращает (etag, last_modified), last_modified может быть None.
+        По умолчанию - по pk и updated_at объекта; представления, которые
+        выводят связанные данные, переопределяют метод
+        """
+        last_modified = getattr(instance, 'updated_at', None)
+        return make_etag(instance._meta.label, instance.pk, last_modified), last_modified
+
+    def conditional_retrieve(self, request, instance):
+        etag, last_modified = self.get_conditional_validators(instance)
+        response = not_modified_response(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        serializer = self.get_serializer(instance)
+        return set_conditional_headers(Response(serializer.data), etag, last_modified)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_retrieve(request, self.get_object())
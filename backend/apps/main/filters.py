@@ -0,0 +1,19 @@
+from django.contrib.postgres.search import SearchQuery
+from rest_framework import filters
+
+from .models import SEARCH_CONFIG
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    Поиск по ?search= через сохраненный tsvector (GIN индекс) вместо ILIKE '%term%'.
+    Модель должна иметь поле search_vector.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = request.query_params.get(self.search_param, '').strip()
+        if not terms:
+            return queryset
+
+        query = SearchQuery(terms, search_type='websearch', config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=query)
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from apps.partitions import PARTITIONED_TABLES, create_partitions, drop_partitions
+
+
+class Command(BaseCommand):
+
+    help = 'Create monthly partitions ahead of time and optionally drop expired ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--table',
+            choices=sorted(PARTITIONED_TABLES),
+            action='append',
+            help='Partitioned table to maintain (default: all)'
+        )
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            help='Number of future months to create partitions for'
+        )
+        parser.add_argument(
+            '--drop-expired',
+            action='store_true',
+            help='Drop partitions older than the retention period'
+        )
+        parser.add_argument(
+            '--detach',
+            action='store_true',
+            help='With --drop-expired, detach expired partitions instead of dropping them'
+        )
+
+    def handle(self, *args, **options):
+        for table in options['table'] or sorted(PARTITIONED_TABLES):
+            created = create_partitions(table, months_ahead=options['months_ahead'])
+            self.stdout.write(f'{table}: created {", ".join(created) or "nothing"}')
+
+            if options['drop_expired']:
+                removed = drop_partitions(table, detach=options['detach'])
+                action = 'detached' if options['detach'] else 'dropped'
+                self.stdout.write(f'{table}: {action} {", ".join(removed) or "nothing"}')
+
+        self.stdout.write(self.style.SUCCESS('Partitions are up to date'))
@@ -0,0 +1,38 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from apps.main.models import Post
+from apps.main.tasks import generate_post_image_variants
+from apps.accounts.tasks import generate_avatar_variants
+
+
+class Command(BaseCommand):
+
+    help = 'Queue resized variants for post images and avatars that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Rebuild variants even where they already exist'
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').exclude(image__isnull=True)
+        users = get_user_model().objects.exclude(avatar='').exclude(avatar__isnull=True)
+        if not options['all']:
+            posts = posts.filter(image_variants={})
+            users = users.filter(avatar_variants={})
+
+        queued_posts = 0
+        for post_id in posts.values_list('id', flat=True).iterator():
+            generate_post_image_variants.delay(post_id)
+            queued_posts += 1
+        self.stdout.write(f'Post images queued: {queued_posts}')
+
+        queued_users = 0
+        for user_id in users.values_list('id', flat=True).iterator():
+            generate_avatar_variants.delay(user_id)
+            queued_users += 1
+        self.stdout.write(f'Avatars queued: {queued_users}')
+
+        self.stdout.write(self.style.SUCCESS('Image variant generation queued'))
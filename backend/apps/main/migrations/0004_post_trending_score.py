@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_post_search_vector'),
+        # Рейтинг считается по comments_count, который заполняет эта миграция
+        ('comments', '0002_comment_replies_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunSQL(
+            sql=(
+                "UPDATE posts SET trending_score = "
+                "log(greatest(views_count + 2 * comments_count, 1)) "
+                "+ extract(epoch FROM created_at) / 45000"
+            ),
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('status', 'published')), fields=['-trending_score', '-id'], name='posts_trending_published_idx'),
+        ),
+    ]
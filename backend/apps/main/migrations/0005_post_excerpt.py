@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_post_trending_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=202),
+        ),
+        migrations.RunSQL(
+            sql=(
+                "UPDATE posts SET excerpt = CASE "
+                "WHEN char_length(content) > 200 THEN left(content, 200) || '..' "
+                "ELSE content END"
+            ),
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
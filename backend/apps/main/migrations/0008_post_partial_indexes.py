@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_category_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='post',
+            name='posts_status_ecf387_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='post',
+            name='posts_categor_4138d2_idx',
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('status', 'published')), fields=['-created_at', '-id'], name='posts_published_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('status', 'published')), fields=['category', '-created_at', '-id'], name='posts_published_category_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_post_partial_indexes'),
+        ('comments', '0004_comment_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        # Существующие посты: последнее изменение их комментариев
+        migrations.RunSQL(
+            """
+            UPDATE posts SET comments_updated_at = latest.updated_at
+            FROM (SELECT post_id, MAX(updated_at) AS updated_at FROM comments GROUP BY post_id) AS latest
+            WHERE posts.id = latest.post_id
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
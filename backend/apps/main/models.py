@@ -1,12 +1,77 @@
+import math
+
 from django.db import models
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db.models.functions import Cast, Extract, Greatest, Log
+from django.utils import timezone
 from django.utils.text import slugify
 from django.urls import reverse
 
+from config.images import loaded_file_name, variant_file_names
+
+# Конфигурация PostgreSQL для полнотекстового поиска (стемминг и стоп-слова)
+SEARCH_CONFIG = 'english'
+
+# Рейтинг "в тренде": каждые TRENDING_GRAVITY секунд свежести весят
+# как десятикратный рост вовлеченности (просмотры + 2 * комментарии)
+TRENDING_GRAVITY = 45000
+TRENDING_COMMENT_WEIGHT = 2
+
+
+# Длина анонса поста в списках
+EXCERPT_LENGTH = 200
+
+
+def make_excerpt(content):
+    if len(content) > EXCERPT_LENGTH:
+        return content[:EXCERPT_LENGTH] + '..'
+    return content
+
+
+def trending_score(views_count, comments_count, created_at):
+    """Рейтинг поста, посчитанный в Python (для новых постов)"""
+    engagement = max(views_count + TRENDING_COMMENT_WEIGHT * comments_count, 1)
+    return math.log10(engagement) + created_at.timestamp() / TRENDING_GRAVITY
+
+
+def trending_score_expression():
+    """
+    Тот же рейтинг как SQL-выражение для массового UPDATE.
+    Рейтинг не зависит от текущего времени, поэтому пересчитывать
+    нужно только посты, у которых изменились счетчики.
+    """
+    engagement = Greatest(
+        models.F('views_count') + TRENDING_COMMENT_WEIGHT * models.F('comments_count'),
+        models.Value(1),
+        output_field=models.FloatField()
+    )
+    age = Cast(Extract('created_at', 'epoch'), models.FloatField())
+    return Log(10, engagement) + age / TRENDING_GRAVITY
+
+
+def fields_to_update_without(instance, excluded):
+    """
+    Список полей для save() без перечисленных полей.
+    Нужен, чтобы обычное сохранение не затирало счетчики,
+    которые меняются только атомарными UPDATE.
+    """
+    deferred = instance.get_deferred_fields()
+    return [
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key
+        and not field.generated
+        and field.attname not in deferred
+        and field.name not in excluded
+    ]
+
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     slug = models.SlugField(max_length=100, unique=True, blank=True)
 
     class Meta:
@@ -23,41 +88,79 @@ class Category(models.Model):
             self.slug = slugify(self.name)
         super().save(*args, **kwargs)
 
+def active_pin(now=None):
+    """Условие активного закрепа поста: подписка владельца еще не закончилась"""
+    return models.Q(pin_info__active_until__gt=now or timezone.now())
+
+def pinned_order(now=None):
+    """
+    Выражение для сортировки: время закрепления у активных закрепов,
+    NULL у остальных постов (сортировать с nulls_last). Одно соединение
+    с pinned_posts, размер SQL не зависит от числа закрепов
+    """
+    return models.Case(
+        models.When(active_pin(now), then=models.F('pin_info__pinned_at')),
+        output_field=models.DateTimeField()
+    )
+
+def pin_info_prefetch():
+    """
+    Prefetch закрепов вместе с пользователем и его подпиской:
+    закрепы всей страницы грузятся одним запросом
+    """
+    from apps.subscribe.models import PinnedPost
+    return models.Prefetch(
+        'pin_info',
+        queryset=PinnedPost.objects.select_related('user__subscription')
+    )
+
 class PostManager(models.Manager):
     """Менеджер для модели Post с дополнительными методами"""
+    def get_queryset(self):
+        # tsvector нужен только в SQL, в Python его не загружаем
+        return super().get_queryset().defer('search_vector')
+
     def published(self):
         return self.filter(status='published')
 
     def pinned_posts(self):
         return self.filter(
-            pin_info__isnull=False,
-            pin_info__user__subscription__status='active',
-            pin_info__user__subscription__end_date__gt=models.functions.Now(),
+            active_pin(),
             status='published'
+        ).defer(
+            'content'
         ).select_related(
-            'pin_info', 'pin_info__user', 'pin_info__user__subscription'
-        ).order_by('pin_info__pinned_at')
+            'author', 'category'
+        ).prefetch_related(
+            pin_info_prefetch()
+        ).annotate(
+            pinned_position=models.F('pin_info__pinned_at')
+        ).order_by('pinned_position', 'id')
     
     def regular_posts(self):
-        return self.filter(pin_info__isnull=True, status='published')
+        return self.exclude(active_pin()).filter(status='published')
 
-    def with_subscription_info(self):
+    def with_pin_info(self):
         return self.select_related(
-            'author', 'author__subscription', 'category'
-        ).prefetch_related('pin_info')
+            'author', 'category'
+        ).prefetch_related(pin_info_prefetch())
+
+    def with_subscription_info(self):
+        """Посты для списков: без полного текста, с закрепами и подпиской автора"""
+        return self.with_pin_info().select_related('author__subscription').defer('content')
+
+    def trending(self, since=None):
+        """Опубликованные посты по убыванию рейтинга, опционально не старше since"""
+        posts = self.with_subscription_info().filter(status='published')
+        if since is not None:
+            posts = posts.filter(created_at__gte=since)
+        return posts.order_by('-trending_score', '-id')
 
     def get_posts_for_feed(self):
         """Возвращает посты для ленты c правильной сортировкой (сначала закрепленные)"""
-        return self.with_subscription_info().extra(
-            select={
-                'is_pinned_order': """
-                    CASE WHEN pin_info.id IS NOT NULL 
-                         AND pin_info.subscription.status = 'active'
-                         AND pin_info.user.subscription.end_date > NOW()
-                    THEN 0 ELSE 1 END
-                """
-            }
-        ).order_by('is_pinned_order', '-created_at')
+        return self.with_subscription_info().annotate(
+            is_pinned_order=pinned_order()
+        ).order_by(models.F('is_pinned_order').asc(nulls_last=True), '-created_at')
 
 
 class Post(models.Model):
@@ -70,7 +173,9 @@ class Post(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True, blank=True)
     content = models.TextField()
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH + 2, blank=True, editable=False)
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     category = models.ForeignKey(
         Category,
         on_delete=models.SET_NULL,
@@ -91,6 +196,18 @@ class Post(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     views_count = models.PositiveBigIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+    # Время последнего изменения комментариев поста (или профиля их авторов), для ETag
+    comments_updated_at = models.DateTimeField(null=True, blank=True, editable=False)
+    trending_score = models.FloatField(default=0, editable=False)
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('title', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('content', weight='B', config=SEARCH_CONFIG)
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
 
     objects = PostManager()
 
@@ -101,29 +218,83 @@ class Post(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['-created_at']),
+            # Мои посты: все статусы
             models.Index(fields=['author', '-created_at']),
-            models.Index(fields=['status', '-created_at']),
-            models.Index(fields=['category', '-created_at']),
+            # Лента и категории читают только опубликованные посты
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='posts_published_created_idx',
+                condition=models.Q(status='published'),
+            ),
+            models.Index(
+                fields=['category', '-created_at', '-id'],
+                name='posts_published_category_idx',
+                condition=models.Q(status='published'),
+            ),
+            GinIndex(fields=['search_vector']),
+            models.Index(
+                fields=['-trending_score', '-id'],
+                name='posts_trending_published_idx',
+                condition=models.Q(status='published'),
+            ),
         ]
 
     def __str__(self):
         return self.title
     
+    COUNTER_FIELDS = ('views_count', 'comments_count', 'comments_updated_at', 'trending_score')
+    # Пишутся только фоновыми задачами, обычный save() их не трогает
+    DERIVED_FIELDS = ('image_variants',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._previous_image = loaded_file_name(self, 'image') if self.pk else ''
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)
+        if 'content' in self.__dict__:
+            # Анонс храним отдельно, чтобы списки не читали полный текст
+            self.excerpt = make_excerpt(self.content)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'content' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'excerpt'}
+        if self._state.adding:
+            self.trending_score = trending_score(
+                self.views_count, self.comments_count, self.created_at or timezone.now()
+            )
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = fields_to_update_without(
+                self, self.COUNTER_FIELDS + self.DERIVED_FIELDS
+            )
         super().save(*args, **kwargs)
+
+        image = loaded_file_name(self, 'image')
+        if image is not None and image != self._previous_image:
+            self._schedule_image_variants()
+            self._previous_image = image
+
+    def _schedule_image_variants(self):
+        """Производные изображения строятся в Celery после коммита"""
+        from django.db import transaction
+        from .tasks import generate_post_image_variants
+
+        stale_files = variant_file_names(self.__dict__.get('image_variants'))
+        post_id = self.pk
+        transaction.on_commit(lambda: generate_post_image_variants.delay(post_id, stale_files))
     
     def get_absolute_url(self):
         return reverse("post_detail", kwargs={"slug": self.slug})
     
     @property
-    def comments_count(self):
-        return self.comments.filter(is_active=True).count()
-    
+    def pin(self):
+        """Закреп поста или None (берется из prefetch, если он был)"""
+        pins = list(self.pin_info.all())
+        return pins[0] if pins else None
+
     @property
     def is_pinned(self):
-        return hasattr(self, 'pin_info') and self.pin_info is not None   
+        return self.pin is not None
     
     @property
     def can_be_pinned_by_user(self):
@@ -140,26 +311,22 @@ class Post(models.Model):
         if self.author != user:
             return False
         
-        if not hasattr(user, 'subscription') or not user.subscription.is_active:
-            return False
-        return True
+        from apps.subscribe.services import EntitlementService
+        return EntitlementService.get(user).can_pin_posts
     
-    def increment_views(self):
-        self.views_count += 1
-        self.save(update_fields=['views_count'])
-
     def get_pinned_info(self):
-        if self.is_pinned:
-            # Получаем первый объект PinnedPost из RelatedManager
-            pinned_post = self.pin_info.first()
-            if pinned_post:
-                return {
-                    'is_pinned': True,
-                    'pinned_at': pinned_post.pinned_at,
-                    'pinned_by': {
-                        'id': pinned_post.user.id,
-                        'username': pinned_post.user.username,
-                        'has_active_subscription': pinned_post.user.subscription.is_active()
-                    }
-                }
-        return {'is_pinned': False}
\ No newline at end of file
+        pinned_post = self.pin
+        if pinned_post is None:
+            return {'is_pinned': False}
+
+        # Подписка уже загружена через select_related, без нее - None
+        subscription = getattr(pinned_post.user, 'subscription', None)
+        return {
+            'is_pinned': True,
+            'pinned_at': pinned_post.pinned_at,
+            'pinned_by': {
+                'id': pinned_post.user.id,
+                'username': pinned_post.user.username,
+                'has_active_subscription': bool(subscription and subscription.is_active)
+            }
+        }
\ No newline at end of file
@@ -0,0 +1,177 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная (keyset) пагинация без COUNT(*) и OFFSET.
+    Следующая страница начинается строго после последней строки предыдущей,
+    поэтому новые записи не сдвигают выдачу.
+
+    View может вернуть несколько сегментов через get_keyset_segments(queryset):
+    список пар (queryset, ordering), которые отдаются подряд
+    (например, сначала закрепленные посты, потом остальные).
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering=None, page_size=None):
+        if ordering is not None:
+            self.ordering = tuple(ordering)
+        if page_size is not None:
+            self.page_size = page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.next_position = None
+
+        segments = self.get_segments(queryset, view)
+        start_segment, values = self.decode_cursor(request)
+        if start_segment >= len(segments):
+            raise NotFound(self.invalid_cursor_message)
+        if values is not None and len(values) != len(segments[start_segment][1]):
+            raise NotFound(self.invalid_cursor_message)
+
+        results = []
+        for index in range(start_segment, len(segments)):
+            segment_queryset, ordering = segments[index]
+            segment_queryset = segment_queryset.order_by(*ordering)
+            if index == start_segment and values is not None:
+                segment_queryset = segment_queryset.filter(self.after(ordering, values))
+
+            # Берем на одну строку больше, чтобы узнать, есть ли продолжение
+            remaining = self.page_size - len(results)
+            try:
+                rows = list(segment_queryset[:remaining + 1])
+            except (ValidationError, ValueError, TypeError):
+                # Значения из курсора не подошли к типам полей
+                raise NotFound(self.invalid_cursor_message)
+            results.extend(rows[:remaining])
+
+            if len(rows) > remaining:
+                last_values = self.row_values(rows[remaining - 1], ordering) if remaining else None
+                self.next_position = (index, last_values)
+                break
+
+        return results
+
+    def get_segments(self, queryset, view):
+        if view is not None and hasattr(view, 'get_keyset_segments'):
+            return view.get_keyset_segments(queryset)
+        return [(queryset, self.ordering)]
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(*self.next_position))
+
+    @staticmethod
+    def after(ordering, values):
+        """
+        Условие "строго после позиции" для составного порядка сортировки:
+        (a < x) OR (a = x AND b < y) ... с учетом направления каждого поля.
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+
+        # Границу по первому полю дублируем, чтобы планировщик взял диапазон индекса
+        first = ordering[0]
+        bound = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{bound}': values[0]}) & condition
+
+    @staticmethod
+    def row_values(row, ordering):
+        values = []
+        for field in ordering:
+            value = getattr(row, field.lstrip('-'))
+            values.append(value.isoformat() if isinstance(value, datetime) else value)
+        return values
+
+    @staticmethod
+    def encode_cursor(segment, values):
+        payload = json.dumps({'s': segment, 'v': values}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        """Возвращает (номер сегмента, значения полей) или (0, None) для первой страницы"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return 0, None
+
+        try:
+            padding = '=' * (-len(encoded) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(encoded + padding))
+            segment = int(payload['s'])
+            values = payload['v']
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+        if segment < 0 or (values is not None and not isinstance(values, list)):
+            raise NotFound(self.invalid_cursor_message)
+        return segment, values
+
+
+class OptionalKeysetPagination(PageNumberPagination):
+    """
+    По умолчанию обычная постраничная пагинация.
+    С параметром ?pagination=cursor (или ?cursor=...) включается keyset режим
+    по (-created_at, id); параметр ordering в этом режиме не учитывается.
+    """
+    mode_query_param = 'pagination'
+
+    def __init__(self):
+        self.keyset = None
+
+    def is_keyset(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or KeysetPagination.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.is_keyset(request):
+            self.keyset = KeysetPagination(page_size=self.get_page_size(request))
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
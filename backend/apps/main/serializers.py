@@ -1,6 +1,8 @@
 from .models import Category, Post
+from django.utils.html import escape
 from django.utils.text import slugify
 from rest_framework import serializers
+from config.images import image_srcset
 
 class CategorySerializer(serializers.ModelSerializer):
     posts_count = serializers.SerializerMethodField()
@@ -20,6 +22,9 @@ class CategorySerializer(serializers.ModelSerializer):
 class PostListSerializer(serializers.ModelSerializer):
     author = serializers.StringRelatedField()
     category = serializers.StringRelatedField()
+    # В списках вместо полного текста отдаем сохраненный анонс
+    content = serializers.CharField(source='excerpt', read_only=True)
+    image_srcset = serializers.SerializerMethodField()
     comments_count = serializers.ReadOnlyField()
     is_pinned = serializers.ReadOnlyField()
     pinned_info = serializers.SerializerMethodField()
@@ -27,7 +32,7 @@ class PostListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Post
         fields = [
-            'id', 'title', 'slug', 'content', 'image', 'category',
+            'id', 'title', 'slug', 'content', 'image', 'image_srcset', 'category',
             'author', 'created_at', 'updated_at', 'status',
             'views_count', 'comments_count', 'is_pinned', 'pinned_info'
         ]   
@@ -35,19 +40,41 @@ class PostListSerializer(serializers.ModelSerializer):
             'slug', 'author', 'views_count'
         ]
 
+    def get_image_srcset(self, obj):
+        return image_srcset(obj.image_variants, self.context.get('request'))
+
     def get_pinned_info(self, obj):
         return obj.get_pinned_info()
-
-    # we show only up to 200chars of post in post list
-    def to_representation(self, instance):
-        data = super().to_representation(instance)
-        if len(data['content']) > 200:
-            data['content'] = data['content'][:200] + '..'
-        return data
         
+# Границы совпадений от ts_headline: управляющие символы, которых нет в HTML-разметке
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_STOP = '\x03'
+
+
+class HighlightField(serializers.CharField):
+    """
+    Фрагмент с подсветкой: текст поста экранируется, и только после этого
+    границы совпадений заменяются на <mark>, чтобы разметка из поста не попала в страницу
+    """
+
+    def to_representation(self, value):
+        return escape(value).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_STOP, '</mark>')
+
+
+class PostSearchSerializer(PostListSerializer):
+    rank = serializers.FloatField(read_only=True)
+    title_highlight = HighlightField(read_only=True)
+    content_highlight = HighlightField(read_only=True)
+
+    class Meta(PostListSerializer.Meta):
+        fields = PostListSerializer.Meta.fields + [
+            'rank', 'title_highlight', 'content_highlight'
+        ]
+
 class PostDetailSerializer(serializers.ModelSerializer):
     author_info = serializers.SerializerMethodField()
     category_info = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
     comments_count = serializers.ReadOnlyField()
     is_pinned = serializers.ReadOnlyField()
     pinned_info = serializers.SerializerMethodField()
@@ -56,7 +83,7 @@ class PostDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Post
         fields = [
-            'id', 'title', 'slug', 'content', 'image', 'category', 'category_info',
+            'id', 'title', 'slug', 'content', 'image', 'image_srcset', 'category', 'category_info',
             'author', 'author_info', 'created_at', 'updated_at', 'status',
             'views_count', 'comments_count', 'is_pinned', 'pinned_info', 'can_pin',
         ]
@@ -70,8 +97,12 @@ class PostDetailSerializer(serializers.ModelSerializer):
             'id': author.id,
             'username': author.username,
             'full_name': author.full_name,
-            'avatar': author.avatar.url if author.avatar else None
+            'avatar': author.avatar.url if author.avatar else None,
+            'avatar_srcset': image_srcset(author.avatar_variants, self.context.get('request'))
         }
+
+    def get_image_srcset(self, obj):
+        return image_srcset(obj.image_variants, self.context.get('request'))
     
     def get_category_info(self, obj):
         if obj.category:
@@ -0,0 +1,177 @@
+import logging
+import time
+from collections import defaultdict
+
+import redis
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from config.redis_client import get_redis_connection
+from .models import Post, trending_score_expression
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounterService:
+    """
+    Буферизованный счетчик просмотров постов.
+    Просмотры копятся в Redis и периодически сбрасываются в таблицу posts
+    пачкой UPDATE ... SET views_count = views_count + n.
+    """
+    PENDING_KEY = 'posts:views:pending'
+    PROCESSING_KEY = 'posts:views:processing'
+    FLUSH_LOCK_KEY = 'posts:views:flush-lock'
+    FLUSH_LOCK_TIMEOUT = 300
+
+    @staticmethod
+    def record_view(post_id: int) -> int:
+        """Записывает просмотр в Redis, возвращает количество несброшенных просмотров поста"""
+        try:
+            return get_redis_connection().hincrby(ViewCounterService.PENDING_KEY, post_id, 1)
+        except redis.RedisError as e:
+            # Потерянный просмотр лучше, чем упавший запрос на чтение
+            logger.warning(f"Failed to record view for post {post_id}: {e}")
+            return 0
+
+    @staticmethod
+    def flush() -> int:
+        """Сбрасывает накопленные просмотры в БД, возвращает количество обновленных постов"""
+        connection = get_redis_connection()
+        lock = connection.lock(
+            ViewCounterService.FLUSH_LOCK_KEY,
+            timeout=ViewCounterService.FLUSH_LOCK_TIMEOUT
+        )
+        if not lock.acquire(blocking=False):
+            return 0
+
+        try:
+            # Если прошлый сброс упал, сначала дообрабатываем его данные
+            if not connection.exists(ViewCounterService.PROCESSING_KEY):
+                try:
+                    connection.rename(
+                        ViewCounterService.PENDING_KEY,
+                        ViewCounterService.PROCESSING_KEY
+                    )
+                except redis.ResponseError:
+                    # Нет накопленных просмотров
+                    return 0
+
+            counts = connection.hgetall(ViewCounterService.PROCESSING_KEY)
+
+            # Группируем посты по приросту, чтобы обойтись минимумом UPDATE
+            posts_by_increment = defaultdict(list)
+            for post_id, views in counts.items():
+                posts_by_increment[int(views)].append(int(post_id))
+
+            with transaction.atomic():
+                for increment, post_ids in posts_by_increment.items():
+                    Post.objects.filter(id__in=post_ids).update(
+                        views_count=F('views_count') + increment
+                    )
+
+            connection.delete(ViewCounterService.PROCESSING_KEY)
+            TrendingService.mark_dirty(int(post_id) for post_id in counts)
+            return len(counts)
+        finally:
+            lock.release()
+
+
+class TrendingService:
+    """
+    Инкрементальный пересчет trending_score.
+    Посты с изменившимися счетчиками попадают в множество в Redis,
+    периодическая задача пересчитывает рейтинг только для них.
+    """
+    DIRTY_KEY = 'posts:trending:dirty'
+    BATCH_SIZE = 1000
+
+    @staticmethod
+    def mark_dirty(post_ids) -> None:
+        """Помечает посты для пересчета после коммита текущей транзакции"""
+        post_ids = list(post_ids)
+        if not post_ids:
+            return
+
+        def add():
+            try:
+                get_redis_connection().sadd(TrendingService.DIRTY_KEY, *post_ids)
+            except redis.RedisError as e:
+                logger.warning(f"Failed to mark posts for trending update: {e}")
+
+        transaction.on_commit(add)
+
+    @staticmethod
+    def recompute(post_ids=None) -> int:
+        """Пересчитывает рейтинг одним UPDATE, None - для всех постов"""
+        posts = Post.objects.all() if post_ids is None else Post.objects.filter(id__in=post_ids)
+        return posts.update(trending_score=trending_score_expression())
+
+    @staticmethod
+    def update_dirty() -> int:
+        """Пересчитывает рейтинг помеченных постов, возвращает их количество"""
+        connection = get_redis_connection()
+        updated = 0
+        while True:
+            post_ids = connection.spop(TrendingService.DIRTY_KEY, TrendingService.BATCH_SIZE)
+            if not post_ids:
+                return updated
+
+            try:
+                TrendingService.recompute([int(post_id) for post_id in post_ids])
+            except Exception:
+                # Возвращаем пачку, чтобы пересчитать ее при следующем запуске
+                connection.sadd(TrendingService.DIRTY_KEY, *post_ids)
+                raise
+            updated += len(post_ids)
+
+
+class HomePageService:
+    """
+    Кэшированный снимок данных главной страницы.
+    Снимок хранится дольше, чем считается свежим: по истечении свежести
+    пересобирает его только один воркер (взявший блокировку),
+    остальные в это время отдают устаревшую копию.
+    """
+    DATA_KEY = 'home:snapshot'
+    FRESH_KEY = 'home:snapshot:fresh'
+    LOCK_KEY = 'home:snapshot:rebuild-lock'
+    FRESH_TIMEOUT = 60
+    DATA_TIMEOUT = 3600
+    LOCK_TIMEOUT = 30
+    WAIT_TIMEOUT = 3
+    WAIT_INTERVAL = 0.05
+
+    @staticmethod
+    def get(build):
+        """Возвращает снимок, build() вызывается только при пересборке"""
+        data = cache.get(HomePageService.DATA_KEY)
+        if data is not None and cache.get(HomePageService.FRESH_KEY):
+            return data
+
+        if cache.add(HomePageService.LOCK_KEY, 1, HomePageService.LOCK_TIMEOUT):
+            try:
+                data = build()
+                cache.set(HomePageService.DATA_KEY, data, HomePageService.DATA_TIMEOUT)
+                cache.set(HomePageService.FRESH_KEY, 1, HomePageService.FRESH_TIMEOUT)
+                return data
+            finally:
+                cache.delete(HomePageService.LOCK_KEY)
+
+        if data is not None:
+            return data
+
+        # Снимка еще нет, а его уже собирает другой воркер: ждем результат
+        deadline = time.monotonic() + HomePageService.WAIT_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(HomePageService.WAIT_INTERVAL)
+            data = cache.get(HomePageService.DATA_KEY)
+            if data is not None:
+                return data
+
+        return build()
+
+    @staticmethod
+    def invalidate():
+        """Помечает снимок устаревшим после коммита текущей транзакции"""
+        transaction.on_commit(lambda: cache.delete(HomePageService.FRESH_KEY))
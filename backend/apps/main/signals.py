@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Category, Post
+from .services import HomePageService
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_home_page(sender, **kwargs):
+    """Главная страница показывает посты и категории, поэтому снимок устаревает"""
+    HomePageService.invalidate()
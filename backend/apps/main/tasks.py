@@ -0,0 +1,54 @@
+import logging
+
+from celery import shared_task
+from PIL import Image
+
+from config.images import build_image_variants, delete_image_variants, variant_file_names
+from .models import Post
+from .services import TrendingService, ViewCounterService
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def flush_post_views():
+    """Периодический сброс накопленных просмотров постов в БД"""
+    updated_posts = ViewCounterService.flush()
+
+    return {'updated_posts': updated_posts}
+
+
+@shared_task
+def update_trending_scores():
+    """Периодический пересчет рейтинга постов с изменившимися счетчиками"""
+    updated_posts = TrendingService.update_dirty()
+
+    return {'updated_posts': updated_posts}
+
+
+@shared_task
+def generate_post_image_variants(post_id, stale_files=()):
+    """
+    Строит производные изображения поста и удаляет файлы прежних.
+    Если картинку успели заменить, результат отбрасывается:
+    для новой картинки поставлена своя задача.
+    """
+    post = Post.objects.filter(pk=post_id).only('id', 'image').first()
+    variants = {}
+    if post is not None and post.image:
+        name = post.image.name
+        try:
+            variants = build_image_variants(name)
+        except (OSError, Image.DecompressionBombError) as e:
+            logger.warning(f"Failed to build image variants for post {post_id}: {e}")
+            return {'post_id': post_id, 'variants': 0}
+
+        if not Post.objects.filter(pk=post_id, image=name).update(image_variants=variants):
+            delete_image_variants(variant_file_names(variants))
+            variants = {}
+    elif post is not None:
+        Post.objects.filter(pk=post_id).update(image_variants={})
+
+    delete_image_variants(stale_files)
+
+    return {'post_id': post_id, 'variants': len(variants)}
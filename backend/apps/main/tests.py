@@ -1,3 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
 
-# Create your tests here.
+from .models import Category, Post
+
+
+class IndexUsageTestCase(TestCase):
+    """
+    Горячие выборки должны читаться по индексам.
+    Seq scan отключается, чтобы на маленькой тестовой таблице
+    план совпадал с планом на реальном объеме данных.
+    """
+
+    def assertUsesIndex(self, queryset, index_name):
+        # EXPLAIN по SQL запроса: QuerySet.explain() не умеет фильтры по Window
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}', params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        self.assertIn(index_name, plan, plan)
+
+
+class PostIndexTests(IndexUsageTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = get_user_model().objects.create_user(
+            username='author', email='author@example.com', password='password'
+        )
+        cls.category = Category.objects.create(name='News')
+        for status in ('published', 'draft'):
+            Post.objects.create(
+                title=f'Post {status}', content='Text', author=author,
+                category=cls.category, status=status
+            )
+
+    def test_published_feed_uses_partial_index(self):
+        posts = Post.objects.filter(status='published').order_by('-created_at', '-id')[:20]
+        self.assertUsesIndex(posts, 'posts_published_created_idx')
+
+    def test_category_feed_uses_partial_index(self):
+        posts = Post.objects.filter(
+            category=self.category, status='published'
+        ).order_by('-created_at', '-id')[:20]
+        self.assertUsesIndex(posts, 'posts_published_category_idx')
+
+    def test_trending_uses_partial_index(self):
+        posts = Post.objects.filter(status='published').order_by('-trending_score', '-id')[:10]
+        self.assertUsesIndex(posts, 'posts_trending_published_idx')
@@ -11,6 +11,8 @@ urlpatterns = [
     #Posts
     path('', views.PostListCreateView.as_view(), name='post-list'),
     path('my-posts/', views.MyPostsView.as_view(), name='my-posts'),
+    path('search/', views.PostSearchView.as_view(), name='post-search'),
+    path('home/', views.home_page, name='home-page'),
     path('popular/', views.popular_posts, name='popular-posts'),
     path('pinned/', views.pinned_posts_only, name='pinned-posts-only'),
     path('recent/', views.recent_posts, name='recent-posts'),
@@ -1,17 +1,47 @@
 from rest_framework import generics, status, filters, permissions
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
+from django.db.models import Count, F, Max, Q
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
 from django.shortcuts import get_object_or_404
-from .models import Category, Post
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from datetime import timedelta
+from .models import SEARCH_CONFIG, Category, Post, active_pin, pinned_order
 from .serializers import (
+    HIGHLIGHT_START,
+    HIGHLIGHT_STOP,
     CategorySerializer,
     PostListSerializer,
+    PostSearchSerializer,
     PostDetailSerializer,
     PostCreateUpdateSerializer
 )
 from .permissions import IsAuthorOrReadOnly
+from .pagination import OptionalKeysetPagination
+from .filters import FullTextSearchFilter
+from .conditional import ConditionalRetrieveMixin, latest, make_etag
+from .services import HomePageService, ViewCounterService
+from apps.subscribe.services import EntitlementService
+
+# Окна для ?window= у трендовых подборок
+TRENDING_WINDOWS = {
+    'day': timedelta(days=1),
+    'week': timedelta(days=7),
+    'month': timedelta(days=30),
+    'all': None,
+}
+
+
+def get_trending_since(request, default='all'):
+    """Начало окна из параметра ?window=day|week|month|all"""
+    window = request.query_params.get('window', default)
+    if window not in TRENDING_WINDOWS:
+        raise ValidationError({'window': f'Must be one of: {", ".join(TRENDING_WINDOWS)}'})
+    period = TRENDING_WINDOWS[window]
+    return timezone.now() - period if period else None
 
 class CategoryListCreateView(generics.ListCreateAPIView):
     """API endpoint для списка категорий"""
@@ -23,13 +53,22 @@ class CategoryListCreateView(generics.ListCreateAPIView):
     ordering_fields = ['name', 'created_at']
     ordering = ['name']
 
-class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
+class CategoryDetailView(ConditionalRetrieveMixin, generics.RetrieveUpdateDestroyAPIView):
     """API endpoint для конкретной категории"""
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     lookup_field = 'slug'
 
+    def get_conditional_validators(self, instance):
+        # Дата берется по всем постам категории: снятие с публикации тоже меняет posts_count
+        posts = instance.posts.aggregate(
+            published=Count('id', filter=Q(status='published')),
+            last_modified=Max('updated_at')
+        )
+        etag = make_etag(instance.pk, instance.updated_at, posts['published'])
+        return etag, latest(instance.updated_at, posts['last_modified'])
+
 class PostListCreateView(generics.ListCreateAPIView):
     """
     API endpoint для списка постов с поддержкой закрепленных постов.
@@ -37,37 +76,46 @@ class PostListCreateView(generics.ListCreateAPIView):
     """
     serializer_class = PostListSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = OptionalKeysetPagination
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
     filterset_fields = ['author', 'category', 'status']
-    search_fields = ['title', 'content']
     ordering_fields = ['title', 'created_at', 'updated_at', 'views_count']
     ordering = ['-created_at']
 
+    def show_pinned_first(self):
+        # Проверяем, нужна ли сортировка с учетом закрепленных постов
+        ordering = self.request.query_params.get('ordering', '')
+        return not ordering or ordering in ['-created_at', 'created_at']
+
     def get_queryset(self):
 
-        queryset = Post.objects.select_related('author', 'category')
+        queryset = Post.objects.with_pin_info().defer('content')
+
+        # В keyset режиме порядок с закрепленными задают сегменты пагинации
+        if self.show_pinned_first() and not self.paginator.is_keyset(self.request):
+            # Используем правильный метод менеджера для закрепленных постов
+            queryset = Post.objects.get_posts_for_feed()
 
         if not self.request.user.is_authenticated: 
-            queryset = queryset.filter(status='published')
-        else:
-            queryset = queryset.filter(
-                Q(status='published') | Q(author=self.request.user)
-            )
+            return queryset.filter(status='published')
+        return queryset.filter(
+            Q(status='published') | Q(author=self.request.user)
+        )
 
-        # Проверяем, нужна ли сортировка с учетом закрепленных постов
-        ordering = self.request.query_params.get('ordering', '')
-        show_pinned_first = not ordering or ordering in ['-created_at', 'created_at']
+    def get_keyset_segments(self, queryset):
+        """Сегменты для keyset пагинации: сначала закрепленные посты, затем лента"""
+        ordering = self.paginator.keyset.ordering
+        if not self.show_pinned_first():
+            return [(queryset, ordering)]
 
-        if show_pinned_first:
-            # Используем правильный метод менеджера для закрепленных постов
-            base_queryset = Post.objects.get_posts_for_feed()
-            if not self.request.user.is_authenticated:
-                return base_queryset.filter(status='published')
-            else:
-                return base_queryset.filter(
-                    Q(status='published') | Q(author=self.request.user)
-                )
-        return queryset
+        now = timezone.now()
+        pinned = queryset.filter(active_pin(now)).annotate(
+            pin_pinned_at=F('pin_info__pinned_at')
+        )
+        return [
+            (pinned, ('pin_pinned_at', 'id')),
+            (queryset.exclude(active_pin(now)), ordering),
+        ]
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -82,9 +130,9 @@ class PostListCreateView(generics.ListCreateAPIView):
             response.data['pinned_count'] = pinned_count
         return response
 
-class PostDetailView(generics.RetrieveUpdateDestroyAPIView):
+class PostDetailView(ConditionalRetrieveMixin, generics.RetrieveUpdateDestroyAPIView):
     """API endpoint для конкретного поста"""
-    queryset = Post.objects.select_related('author', 'category')
+    queryset = Post.objects.with_pin_info()
     serializer_class = PostDetailSerializer
     permission_classes = [IsAuthorOrReadOnly]
     lookup_field = 'slug' 
@@ -98,61 +146,85 @@ class PostDetailView(generics.RetrieveUpdateDestroyAPIView):
         instance = self.get_object()
 
         if request.method == 'GET':
-            instance.increment_views() 
-        
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+            # Просмотр пишем в буфер, а не в таблицу posts
+            ViewCounterService.record_view(instance.pk)
+
+        response = self.conditional_retrieve(request, instance)
+        # can_pin зависит от пользователя
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+    def get_conditional_validators(self, instance):
+        # Счетчики меняются без updated_at, поэтому Last-Modified не отдаем
+        etag = make_etag(
+            instance.pk, instance.updated_at, instance.views_count, instance.comments_count,
+            instance.image_variants, instance.author.updated_at,
+            instance.category.updated_at if instance.category else None,
+            instance.get_pinned_info(),
+            self.request.user.pk, instance.can_be_pinned_by(self.request.user),
+        )
+        return etag, None
     
 class MyPostsView(generics.ListAPIView):
     """API endpoint для личных постов"""
     serializer_class = PostListSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = OptionalKeysetPagination
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'status']
-    search_fields = ['title', 'content']
     ordering_fields = ['created_at', 'updated_at', 'views_count', 'title']
     ordering = ['-created_at']
 
     def get_queryset(self):
-        return Post.objects.filter(
+        return Post.objects.with_pin_info().defer('content').filter(
             author=self.request.user
-        ).select_related('author', 'category')
+        )
     
+class PostSearchView(generics.ListAPIView):
+    """
+    API endpoint для полнотекстового поиска по постам: ?q=<запрос>.
+    Результаты отсортированы по релевантности, с подсветкой совпадений
+    """
+    serializer_class = PostSearchSerializer
+    permission_classes = [permissions.AllowAny]
+    filter_backends = []
+
+    def get_queryset(self):
+        terms = self.request.query_params.get('q', '').strip()
+        if not terms:
+            return Post.objects.none()
+
+        query = SearchQuery(terms, search_type='websearch', config=SEARCH_CONFIG)
+        highlight = {
+            'config': SEARCH_CONFIG,
+            # Сериализатор экранирует текст и заменяет границы на <mark>
+            'start_sel': HIGHLIGHT_START,
+            'stop_sel': HIGHLIGHT_STOP,
+        }
+        # Подсветка считается только для строк текущей страницы (после ORDER BY ... LIMIT)
+        return Post.objects.with_pin_info().defer('content').filter(
+            status='published',
+            search_vector=query
+        ).annotate(
+            rank=SearchRank(F('search_vector'), query),
+            title_highlight=SearchHeadline('title', query, highlight_all=True, **highlight),
+            content_highlight=SearchHeadline(
+                'content', query, max_words=35, min_words=15, max_fragments=2, **highlight
+            ),
+        ).order_by('-rank', '-created_at')
+
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def post_by_category(request, category_slug):
     category = get_object_or_404(Category, slug=category_slug)
 
+    # Закрепленные посты первыми (по времени закрепления), затем новые
     posts = Post.objects.with_subscription_info().filter(
         category=category,
         status='published'
-    )
-
-    from django.db.models import Case, When, Value, DateTimeField, BooleanField
-    from django.utils import timezone
-
-    posts = posts.annotate(
-        effective_date=Case(
-            When(
-                pin_info__isnull=False,
-                pin_info__user__subscription__status='active',
-                pin_info__user__subscription__end_date__gt=timezone.now(),
-                then='pin_info__pinned_at'
-            ),
-            default='created_at',
-            output_field=DateTimeField()
-        ),
-    is_pinned_flag=Case(
-            When(
-                pin_info__isnull=False,
-                pin_info__user__subscription__status='active',
-                pin_info__user__subscription__end_date__gt=timezone.now(),
-                then=Value(True)
-            ),
-            default=Value(False),
-            output_field=BooleanField()
-        )
-    ).order_by('-is_pinned_flag', 'effective_date', '-created_at')
+    ).annotate(
+        pinned_position=pinned_order()
+    ).order_by(F('pinned_position').asc(nulls_last=True), '-created_at')
 
     serializer = PostListSerializer(posts, many=True, context={'request': request})
 
@@ -162,87 +234,109 @@ def post_by_category(request, category_slug):
         'pinned_posts_count': sum(1 for post in serializer.data if post.get('is_pinned', False))
     })
     
-@api_view(['GET'])
-@permission_classes([permissions.AllowAny])
-def popular_posts(request):
-    posts = Post.objects.with_subscription_info().filter(
-        status='published',
-    ).order_by('-views_count')[:10]
+def serialize_posts(posts, request):
+    return PostListSerializer(posts, many=True, context={'request': request}).data
 
-    serializer = PostListSerializer(posts, many=True, context={'request': request})
 
-    return Response(serializer.data)
+def get_popular_data(request, since):
+    return serialize_posts(Post.objects.trending(since=since)[:10], request)
 
-@api_view(['GET'])
-@permission_classes([permissions.AllowAny])
-def pinned_posts_only(request):
 
-    posts = Post.objects.pinned_posts()
-    
-    serializer = PostListSerializer(
-        posts,
-        many=True,
-        context={'request': request}
-    )
-    return Response({
-        'count': posts.count(),
-        'results': serializer.data
-    })
+def get_pinned_data(request):
+    posts = list(Post.objects.pinned_posts())
+    return {
+        'count': len(posts),
+        'results': serialize_posts(posts, request)
+    }
 
-@api_view(['GET'])
-@permission_classes([permissions.AllowAny])
-def recent_posts(request):
+
+def get_recent_data(request):
     posts = Post.objects.with_subscription_info().filter(
         status='published'
     ).order_by('-created_at')[:10]
+    return serialize_posts(posts, request)
 
-    serializer = PostListSerializer(
-        posts, 
-        many=True, 
-        context={'request': request}
-    )
-    return Response(serializer.data)
 
-@api_view(['GET'])
-@permission_classes([permissions.AllowAny])
-def featured_posts(request):
+def get_featured_data(request, since):
     """
     Рекомендуемые посты для главной страницы:
     - Закрепленные посты (максимум 3)
-    - Популярные посты за последнюю неделю
+    - Посты в тренде за окно since, кроме уже показанных закрепленных
     """
-    from django.utils import timezone
-    from datetime import timedelta
-
+    pinned_posts = list(Post.objects.pinned_posts()[:3])
 
-    pinned_posts = Post.objects.pinned_posts()[:3]
-
-    # Популярные посты за неделю
-    week_ago = timezone.now() - timedelta(days=7)
-    popular_posts = Post.objects.with_subscription_info().filter(
-        status='published',
-        created_at__gte=week_ago
-    ).exclude(
+    popular_posts = Post.objects.trending(since=since).exclude(
         id__in=[post.id for post in pinned_posts]
-    ).order_by('-views_count')[:6]
-    
-    pinned_serializer = PostListSerializer(
-        pinned_posts,
-        many=True,
-        context={'request': request}
-    )
-
-    popular_serializer = PostListSerializer(
-        popular_posts,
-        many=True,
-        context={'request': request}
-    )
+    )[:6]
 
-    return Response({
-        'pinned_posts': pinned_serializer.data,
-        'popular_posts': popular_serializer.data,
+    return {
+        'pinned_posts': serialize_posts(pinned_posts, request),
+        'popular_posts': serialize_posts(popular_posts, request),
         'total_pinned': Post.objects.pinned_posts().count()
-    })
+    }
+
+
+def build_home_page():
+    """
+    Все секции главной страницы одним снимком. Снимок общий для всех запросов,
+    поэтому собирается без request: URL картинок в нем относительные
+    """
+    return {
+        # Окно фиксированное, а не из ?window=
+        'featured': get_featured_data(None, since=timezone.now() - TRENDING_WINDOWS['week']),
+        'recent': get_recent_data(None),
+        'popular': get_popular_data(None, since=None),
+        'pinned': get_pinned_data(None),
+        'categories': CategorySerializer(Category.objects.order_by('name'), many=True).data,
+    }
+
+
+def absolutize_post_urls(posts, request):
+    """Делает URL картинок постов абсолютными для хоста и схемы текущего запроса"""
+    for post in posts:
+        if post.get('image'):
+            post['image'] = request.build_absolute_uri(post['image'])
+        for entry in (post.get('image_srcset') or {}).values():
+            for key, value in entry.items():
+                if key not in ('width', 'height'):
+                    entry[key] = request.build_absolute_uri(value)
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def home_page(request):
+    """
+    Данные главной страницы (featured, recent, popular, pinned, categories)
+    из общего кэшированного снимка вместо пяти отдельных запросов.
+    """
+    data = HomePageService.get(build_home_page)
+    for posts in (
+        data['featured']['pinned_posts'], data['featured']['popular_posts'],
+        data['recent'], data['popular'], data['pinned']['results'],
+    ):
+        absolutize_post_urls(posts, request)
+    return Response(data)
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def popular_posts(request):
+    """Посты в тренде: просмотры и комментарии с затуханием по времени"""
+    return Response(get_popular_data(request, since=get_trending_since(request)))
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def pinned_posts_only(request):
+    return Response(get_pinned_data(request))
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def recent_posts(request):
+    return Response(get_recent_data(request))
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def featured_posts(request):
+    """Закрепленные посты и посты в тренде (по умолчанию за неделю, ?window=)"""
+    return Response(get_featured_data(request, since=get_trending_since(request, default='week')))
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -250,7 +344,7 @@ def toggle_post_pinned_status(request, slug):
     post = get_object_or_404(Post, slug=slug, author=request.user, status='published')
 
     #Проверяем подписку
-    if not hasattr(request.user, 'subscription') or not request.user.subscription.is_active:
+    if not EntitlementService.get(request.user).can_pin_posts:
         return Response({
             'error': 'Subscription is required to pin posts'
         }, status=status.HTTP_403_FORBIDDEN)
@@ -261,7 +355,7 @@ def toggle_post_pinned_status(request, slug):
         #Проверяем если пост закреплен
         if post.is_pinned:
             #Открепляем
-            post.pin_info.delete()
+            post.pin_info.all().delete()
             message='Post unpinned successfully'
             is_pinned=False
         else:
@@ -0,0 +1,140 @@
+import logging
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+# Таблицы, секционированные по месяцам: таблица -> (ключ секционирования, настройка срока хранения)
+PARTITIONED_TABLES = {
+    'subscription_history': ('created_at', 'SUBSCRIPTION_HISTORY_RETENTION_MONTHS'),
+    'webhook_events': ('occurred_at', 'WEBHOOK_EVENTS_RETENTION_MONTHS'),
+}
+
+PARTITION_NAME = re.compile(r'_p(\d{4})(\d{2})$')
+
+
+def month_start(value):
+    """Начало месяца (UTC), в котором находится value"""
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y%m}'
+
+
+def list_partitions(table) -> dict:
+    """Месячные секции таблицы: {имя: начало месяца}. Секция DEFAULT не входит"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+            """,
+            [table]
+        )
+        names = [name for name, in cursor.fetchall()]
+
+    partitions = {}
+    for name in names:
+        match = PARTITION_NAME.search(name)
+        if match:
+            partitions[name] = datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc)
+    return partitions
+
+
+def create_partitions(table, months_ahead=None, start=None) -> list:
+    """
+    Создает недостающие секции с месяца start (по умолчанию текущего)
+    на months_ahead месяцев вперед. Строки, успевшие попасть в секцию
+    DEFAULT за этот месяц, переносятся в новую секцию.
+    """
+    column, _ = PARTITIONED_TABLES[table]
+    if months_ahead is None:
+        months_ahead = settings.PARTITION_MONTHS_AHEAD
+    first = month_start(start or timezone.now())
+    existing = list_partitions(table)
+
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(first, offset)
+        name = partition_name(table, month)
+        if name in existing:
+            continue
+        _create_partition(table, column, name, month, add_months(month, 1))
+        created.append(name)
+    return created
+
+
+def _create_partition(table, column, name, lower, upper):
+    default = f'{table}_default'
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM {default} WHERE {column} >= %s AND {column} < %s)',
+            [lower, upper]
+        )
+        (misplaced,) = cursor.fetchone()
+
+        if not misplaced:
+            cursor.execute(
+                f'CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)',
+                [lower, upper]
+            )
+            return
+
+        # Пока в DEFAULT есть строки диапазона, секцию к таблице не прикрепить
+        logger.warning(f"Moving rows of {name} out of {default}")
+        cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {default}')
+        cursor.execute(
+            f'CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)',
+            [lower, upper]
+        )
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {default} WHERE {column} >= %s AND {column} < %s RETURNING *) '
+            f'INSERT INTO {table} SELECT * FROM moved',
+            [lower, upper]
+        )
+        cursor.execute(f'ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT')
+
+
+def drop_partitions(table, retention_months=None, detach=False, now=None) -> list:
+    """
+    Удаляет секции целиком (без построчного DELETE), если весь месяц
+    старше срока хранения. С detach=True секция только отсоединяется
+    и остается отдельной таблицей для архивации.
+    """
+    _, retention_setting = PARTITIONED_TABLES[table]
+    if retention_months is None:
+        retention_months = getattr(settings, retention_setting)
+    cutoff = add_months(month_start(now or timezone.now()), -retention_months)
+
+    removed = []
+    for name, month in sorted(list_partitions(table).items(), key=lambda item: item[1]):
+        if add_months(month, 1) > cutoff:
+            continue
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {name}')
+            if not detach:
+                cursor.execute(f'DROP TABLE {name}')
+        removed.append(name)
+    return removed
+
+
+def maintain_partitions(table) -> dict:
+    """Секции на будущие месяцы и удаление устаревших: для периодических задач"""
+    return {
+        'created_partitions': create_partitions(table),
+        'dropped_partitions': drop_partitions(table),
+    }
@@ -58,7 +58,7 @@ class RefundAdmin(admin.ModelAdmin):
             'fields': ('created_by',),
         }),
         ('Временные метки', {
-            'fields': ('created_at', 'processed_at'),
+            'fields': ('occurred_at', 'created_at', 'processed_at'),
             'classes': ('collapse',)
         }),
     )
@@ -66,21 +66,21 @@ class RefundAdmin(admin.ModelAdmin):
 
 @admin.register(WebhookEvent)
 class WebhookEventAdmin(admin.ModelAdmin):
-    list_display = ['id', 'provider', 'event_type', 'status', 'created_at']
+    list_display = ['id', 'provider', 'event_type', 'status', 'attempts', 'next_retry_at', 'created_at']
     list_filter = ['provider', 'event_type', 'status', 'created_at']
     search_fields = ['event_id', 'event_type']
-    readonly_fields = ['created_at', 'processed_at']
+    readonly_fields = ['created_at', 'processed_at', 'occurred_at', 'ordering_key', 'attempts', 'next_retry_at']
     
     fieldsets = (
         ('Основная информация', {
-            'fields': ('provider', 'event_id', 'event_type', 'status')
+            'fields': ('provider', 'event_id', 'event_type', 'status', 'ordering_key')
         }),
         ('Данные', {
-            'fields': ('data', 'error_message'),
+            'fields': ('data', 'error_message', 'attempts', 'next_retry_at'),
             'classes': ('collapse',)
         }),
         ('Временные метки', {
-            'fields': ('created_at', 'processed_at'),
+            'fields': ('occurred_at', 'created_at', 'processed_at'),
             'classes': ('collapse',)
         }),
     )
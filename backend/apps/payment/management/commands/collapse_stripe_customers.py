@@ -0,0 +1,75 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Case, IntegerField, Value, When
+from apps.payment.models import Payment
+from apps.payment.stripe_client import stripe
+
+
+class Command(BaseCommand):
+
+    help = 'Store one Stripe customer per user and optionally delete duplicate customers created per payment'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--delete-duplicates',
+            action='store_true',
+            help='Delete duplicate Stripe customers that have no succeeded or in-progress payments'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would change'
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        dry_run = options['dry_run']
+
+        payments = Payment.objects.exclude(stripe_customer_id__isnull=True).exclude(stripe_customer_id='')
+
+        # Основной клиент пользователя: из последнего успешного платежа, иначе из последнего платежа
+        canonical = dict(
+            payments.annotate(
+                succeeded=Case(When(status='succeeded', then=Value(1)), default=Value(0), output_field=IntegerField())
+            ).order_by('user_id', '-succeeded', '-created_at', '-id')
+            .distinct('user_id')
+            .values_list('user_id', 'stripe_customer_id')
+        )
+
+        users = list(
+            User.objects.filter(id__in=canonical, stripe_customer_id__isnull=True).only('id', 'stripe_customer_id')
+        )
+        for user in users:
+            user.stripe_customer_id = canonical[user.id]
+        if not dry_run:
+            User.objects.bulk_update(users, ['stripe_customer_id'], batch_size=1000)
+        self.stdout.write(f'Users linked to a Stripe customer: {len(users)}')
+
+        # Клиент пользователя мог уже быть сохранен раньше - он и остается основным
+        kept = set(
+            User.objects.exclude(stripe_customer_id__isnull=True).values_list('stripe_customer_id', flat=True)
+        ) | {user.stripe_customer_id for user in users}
+        # Клиентов с оплатами и незавершенными checkout не трогаем
+        in_use = set(
+            payments.filter(status__in=['succeeded', 'pending', 'processing'])
+            .values_list('stripe_customer_id', flat=True)
+        )
+        duplicates = sorted(
+            set(payments.order_by().values_list('stripe_customer_id', flat=True).distinct()) - kept - in_use
+        )
+        self.stdout.write(f'Unused duplicate Stripe customers: {len(duplicates)}')
+
+        if options['delete_duplicates'] and not dry_run:
+            deleted = 0
+            for customer_id in duplicates:
+                try:
+                    stripe.Customer.delete(customer_id)
+                    deleted += 1
+                except stripe.error.InvalidRequestError:
+                    # Клиент уже удален в Stripe
+                    pass
+                except stripe.error.StripeError as e:
+                    self.stdout.write(self.style.WARNING(f'Failed to delete customer {customer_id}: {e}'))
+            self.stdout.write(f'Duplicate Stripe customers deleted: {deleted}')
+
+        self.stdout.write(self.style.SUCCESS('Stripe customers collapsed'))
@@ -0,0 +1,240 @@
+import json
+import random
+import re
+import signal
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Ресурсы, которые вызывает проект: путь -> (префикс id, тип объекта)
+RESOURCES = {
+    'checkout/sessions': ('cs', 'checkout.session'),
+    'customers': ('cus', 'customer'),
+    'payment_intents': ('pi', 'payment_intent'),
+    'refunds': ('re', 'refund'),
+    'products': ('prod', 'product'),
+    'prices': ('price', 'price'),
+}
+
+KEY_PART = re.compile(r'\[([^\]]*)\]')
+
+
+def parse_form(body):
+    """Разбирает form-encoded тело Stripe (metadata[payment_id]=1) во вложенный словарь"""
+    params = {}
+    for key, value in parse_qsl(body, keep_blank_values=True):
+        name, _, rest = key.partition('[')
+        parts = [name] + KEY_PART.findall('[' + rest) if rest else [name]
+        target = params
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return params
+
+
+class StubState:
+    """Объекты, ответы по ключам идемпотентности и статистика заглушки"""
+
+    def __init__(self, latency, jitter, error_rate, complete_sessions):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.complete_sessions = complete_sessions
+        self.lock = threading.Lock()
+        self.objects = {}
+        self.idempotent_responses = {}
+        self.stats = Counter()
+
+    def build_object(self, resource, params):
+        prefix, object_type = RESOURCES[resource]
+        obj = {
+            'id': f'{prefix}_{uuid.uuid4().hex[:24]}',
+            'object': object_type,
+            'created': int(time.time()),
+            'livemode': False,
+            **params,
+        }
+        obj.setdefault('metadata', {})
+        if resource == 'checkout/sessions':
+            obj.update(
+                url=f'https://checkout.stripe.test/pay/{obj["id"]}',
+                status='open',
+                payment_status='unpaid',
+                payment_intent=None,
+            )
+        elif resource == 'payment_intents':
+            obj.update(client_secret=f'{obj["id"]}_secret', status='requires_payment_method')
+        elif resource == 'refunds':
+            obj.update(status='succeeded')
+        return obj
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'StripeStub/1.0'
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode() if length else ''
+
+        delay = self.state.latency + random.uniform(0, self.state.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if random.random() < self.state.error_rate:
+            self.respond(500, {'error': {'type': 'api_error', 'message': 'Stub server failure'}},
+                         {'Stripe-Should-Retry': 'true'})
+            return
+
+        idempotency_key = self.headers.get('Idempotency-Key') if method == 'POST' else None
+        if idempotency_key:
+            with self.state.lock:
+                cached = self.state.idempotent_responses.get(idempotency_key)
+            if cached:
+                self.respond(*cached, {'Idempotent-Replayed': 'true'})
+                return
+
+        status, payload = self.handle_api(method, urlparse(self.path).path, body)
+        if idempotency_key and status < 500:
+            with self.state.lock:
+                self.state.idempotent_responses[idempotency_key] = (status, payload)
+        self.respond(status, payload)
+
+    def handle_api(self, method, path, body):
+        path = path.removeprefix('/v1/').strip('/')
+        if path == 'balance' and method == 'GET':
+            return 200, {'object': 'balance', 'available': [], 'pending': [], 'livemode': False}
+
+        resource = next((name for name in RESOURCES if path == name or path.startswith(name + '/')), None)
+        if resource is None:
+            return 404, {'error': {'type': 'invalid_request_error', 'message': f'Unrecognized request URL ({path})'}}
+        object_id = path[len(resource):].strip('/')
+
+        if method == 'POST' and not object_id:
+            obj = self.state.build_object(resource, parse_form(body))
+            with self.state.lock:
+                self.state.objects[obj['id']] = obj
+            return 200, obj
+
+        with self.state.lock:
+            obj = self.state.objects.get(object_id)
+        if obj is None:
+            return 404, {'error': {
+                'type': 'invalid_request_error',
+                'code': 'resource_missing',
+                'message': f'No such {RESOURCES[resource][1]}: {object_id}',
+            }}
+
+        if method == 'DELETE':
+            with self.state.lock:
+                self.state.objects.pop(object_id, None)
+            return 200, {'id': object_id, 'object': obj['object'], 'deleted': True}
+        if method == 'POST':
+            obj.update(parse_form(body))
+        if resource == 'checkout/sessions' and self.state.complete_sessions:
+            obj.update(status='complete', payment_status='paid')
+        return 200, obj
+
+    def respond(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Request-Id', f'req_{uuid.uuid4().hex[:14]}')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        with self.state.lock:
+            self.state.stats[status] += 1
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Run a local Stripe API stand-in for offline benchmarks and failure testing. '
+        'Point STRIPE_API_BASE at it, e.g. http://127.0.0.1:12111'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=12111)
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0,
+            help='Added delay per request in milliseconds'
+        )
+        parser.add_argument(
+            '--jitter',
+            type=float,
+            default=0,
+            help='Random extra delay per request, up to this many milliseconds'
+        )
+        parser.add_argument(
+            '--error-rate',
+            type=float,
+            default=0,
+            help='Share of requests answered with a retryable 500 (0..1)'
+        )
+        parser.add_argument(
+            '--complete-sessions',
+            action='store_true',
+            help='Report retrieved checkout sessions as complete and paid'
+        )
+
+    def handle(self, *args, **options):
+        if not 0 <= options['error_rate'] <= 1:
+            raise CommandError('--error-rate must be between 0 and 1')
+
+        server = ThreadingHTTPServer((options['host'], options['port']), StubHandler)
+        server.daemon_threads = True
+        server.verbose = options['verbosity'] > 1
+        server.state = StubState(
+            latency=options['latency'] / 1000,
+            jitter=options['jitter'] / 1000,
+            error_rate=options['error_rate'],
+            complete_sessions=options['complete_sessions'],
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Stripe stub server listening on http://{options["host"]}:{options["port"]}'
+        ))
+        # Сводку печатаем и при остановке контейнера (SIGTERM)
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        started = time.monotonic()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+        elapsed = time.monotonic() - started
+        total = sum(server.state.stats.values())
+        self.stdout.write(f'Requests served: {total} in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.1f}/s)')
+        for status, count in sorted(server.state.stats.items()):
+            self.stdout.write(f'  {status}: {count}')
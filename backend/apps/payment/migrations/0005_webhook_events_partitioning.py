@@ -0,0 +1,130 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+# Таблица пересоздается секционированной по месяцам occurred_at.
+# Первичный ключ и уникальность event_id включают ключ секционирования,
+# для Django первичным ключом остается id.
+PARTITION_SQL = """
+ALTER TABLE webhook_events RENAME TO webhook_events_unpartitioned;
+ALTER INDEX webhook_events_pkey RENAME TO webhook_events_unpartitioned_pkey;
+ALTER SEQUENCE webhook_events_id_seq RENAME TO webhook_events_unpartitioned_id_seq;
+DROP INDEX webhook_eve_provide_2e40e6_idx, webhook_eve_status_330e1f_idx;
+
+CREATE TABLE webhook_events (
+    id bigint NOT NULL GENERATED BY DEFAULT AS IDENTITY,
+    provider varchar(20) NOT NULL,
+    event_id varchar(255) NOT NULL,
+    event_type varchar(100) NOT NULL,
+    status varchar(20) NOT NULL,
+    data jsonb NOT NULL,
+    processed_at timestamp with time zone NULL,
+    error_message text NULL,
+    created_at timestamp with time zone NOT NULL,
+    occurred_at timestamp with time zone NOT NULL,
+    PRIMARY KEY (id, occurred_at),
+    CONSTRAINT webhook_events_event_id_uniq UNIQUE (event_id, occurred_at)
+) PARTITION BY RANGE (occurred_at);
+
+DO $$
+DECLARE
+    month timestamp := date_trunc('month', LEAST(
+        (SELECT MIN(created_at) FROM webhook_events_unpartitioned), now()
+    ) AT TIME ZONE 'UTC');
+BEGIN
+    WHILE month <= date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months' LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF webhook_events FOR VALUES FROM (%L) TO (%L)',
+            'webhook_events_p' || to_char(month, 'YYYYMM'),
+            month AT TIME ZONE 'UTC',
+            (month + interval '1 month') AT TIME ZONE 'UTC'
+        );
+        month := month + interval '1 month';
+    END LOOP;
+END $$;
+CREATE TABLE webhook_events_default PARTITION OF webhook_events DEFAULT;
+
+INSERT INTO webhook_events (
+    id, provider, event_id, event_type, status, data,
+    processed_at, error_message, created_at, occurred_at
+)
+SELECT
+    id, provider, event_id, event_type, status, data,
+    processed_at, error_message, created_at,
+    -- Как у новых доставок: время события у Stripe, иначе время получения
+    CASE WHEN data->>'created' ~ '^[0-9]+$'
+        THEN to_timestamp((data->>'created')::bigint) ELSE created_at END
+FROM webhook_events_unpartitioned;
+SELECT setval(pg_get_serial_sequence('webhook_events', 'id'), COALESCE(MAX(id), 0) + 1, false)
+FROM webhook_events;
+DROP TABLE webhook_events_unpartitioned;
+
+CREATE INDEX webhook_eve_provide_2e40e6_idx ON webhook_events (provider, event_type);
+CREATE INDEX webhook_eve_status_330e1f_idx ON webhook_events (status);
+"""
+
+UNPARTITION_SQL = """
+ALTER TABLE webhook_events RENAME TO webhook_events_partitioned;
+ALTER INDEX webhook_events_pkey RENAME TO webhook_events_partitioned_pkey;
+ALTER SEQUENCE webhook_events_id_seq RENAME TO webhook_events_partitioned_id_seq;
+DROP INDEX webhook_eve_provide_2e40e6_idx, webhook_eve_status_330e1f_idx;
+
+CREATE TABLE webhook_events (
+    id bigint NOT NULL PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+    provider varchar(20) NOT NULL,
+    event_id varchar(255) NOT NULL UNIQUE,
+    event_type varchar(100) NOT NULL,
+    status varchar(20) NOT NULL,
+    data jsonb NOT NULL,
+    processed_at timestamp with time zone NULL,
+    error_message text NULL,
+    created_at timestamp with time zone NOT NULL
+);
+INSERT INTO webhook_events (
+    id, provider, event_id, event_type, status, data,
+    processed_at, error_message, created_at
+)
+SELECT DISTINCT ON (event_id)
+    id, provider, event_id, event_type, status, data,
+    processed_at, error_message, created_at
+FROM webhook_events_partitioned
+ORDER BY event_id, id;
+SELECT setval(pg_get_serial_sequence('webhook_events', 'id'), COALESCE(MAX(id), 0) + 1, false)
+FROM webhook_events;
+DROP TABLE webhook_events_partitioned;
+
+CREATE INDEX webhook_events_event_id_443fdf2c_like ON webhook_events (event_id varchar_pattern_ops);
+CREATE INDEX webhook_eve_provide_2e40e6_idx ON webhook_events (provider, event_type);
+CREATE INDEX webhook_eve_status_330e1f_idx ON webhook_events (status);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0004_rename_stripe_payment_id_refund_stripe_refund_id'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='webhookevent',
+                    name='occurred_at',
+                    field=models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                migrations.AlterField(
+                    model_name='webhookevent',
+                    name='event_id',
+                    field=models.CharField(max_length=255),
+                ),
+                migrations.AddConstraint(
+                    model_name='webhookevent',
+                    constraint=models.UniqueConstraint(fields=('event_id', 'occurred_at'), name='webhook_events_event_id_uniq'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(PARTITION_SQL, UNPARTITION_SQL),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0005_webhook_events_partitioning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookevent',
+            name='ordering_key',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='webhookevent',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['ordering_key', 'occurred_at', 'id'], name='webhook_events_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0006_webhook_event_ordering_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookevent',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='webhookevent',
+            name='next_retry_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        # Уже упавшие события повторяются в ближайший запуск
+        migrations.RunSQL(
+            "UPDATE webhook_events SET next_retry_at = now() WHERE status = 'failed'",
+            migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='webhookevent',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processed', 'Processed'), ('failed', 'Failed'), ('ignored', 'Ignored'), ('dead', 'Dead')], default='pending', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='webhookevent',
+            index=models.Index(condition=models.Q(('status', 'failed')), fields=['next_retry_at'], name='webhook_events_retry_idx'),
+        ),
+    ]
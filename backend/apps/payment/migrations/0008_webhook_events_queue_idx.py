@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0007_webhook_event_retries'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='webhookevent',
+            name='webhook_events_pending_idx',
+        ),
+        migrations.AddIndex(
+            model_name='webhookevent',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'failed'])), fields=['ordering_key', 'occurred_at', 'id'], name='webhook_events_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+# События, перенесенные 0005 с occurred_at = created_at, получают время
+# события у Stripe, как новые доставки: иначе повторная доставка старого
+# события не совпадет по (event_id, occurred_at) и обработается второй раз.
+# Если такая доставка уже сохранена, старую строку не трогаем.
+BACKFILL_SQL = """
+UPDATE webhook_events AS event
+SET occurred_at = to_timestamp((event.data->>'created')::bigint)
+WHERE event.data->>'created' ~ '^[0-9]+$'
+    AND event.occurred_at <> to_timestamp((event.data->>'created')::bigint)
+    AND NOT EXISTS (
+        SELECT 1 FROM webhook_events AS other
+        WHERE other.event_id = event.event_id
+            AND other.occurred_at = to_timestamp((event.data->>'created')::bigint)
+    )
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0008_webhook_events_queue_idx'),
+    ]
+
+    operations = [
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
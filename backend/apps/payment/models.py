@@ -1,5 +1,8 @@
-from django.db import models
+import random
+
+from django.db import connections, models
 from django.conf import settings
+from django.utils import timezone
 from decimal import Decimal
 
 
@@ -171,6 +174,41 @@ class Refund(models.Model):
         self.save()            
 
 
+class WebhookEventQuerySet(models.QuerySet):
+    def create_if_new(self, **fields):
+        """
+        Сохраняет событие одним запросом INSERT ... ON CONFLICT DO NOTHING RETURNING.
+        Возвращает созданное событие или None, если такое событие уже есть:
+        при параллельной доставке дублей событие достается ровно одному запросу
+        """
+        event = self.model(**fields)
+        opts = self.model._meta
+        connection = connections[self.db]
+        columns = [field for field in opts.concrete_fields if not field.primary_key]
+        values = [
+            field.get_db_prep_save(field.pre_save(event, add=True), connection)
+            for field in columns
+        ]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {opts.db_table} '
+                f'({", ".join(connection.ops.quote_name(field.column) for field in columns)}) '
+                f'VALUES ({", ".join(["%s"] * len(columns))}) '
+                'ON CONFLICT (event_id, occurred_at) DO NOTHING '
+                f'RETURNING {opts.pk.column}',
+                values
+            )
+            row = cursor.fetchone()
+
+        if row is None:
+            return None
+        event.pk = row[0]
+        event._state.adding = False
+        event._state.db = self.db
+        return event
+
+
 class WebhookEvent(models.Model):
     """События Webhook для платежных систем"""
     PROVIDER_CHOICES = [
@@ -183,9 +221,16 @@ class WebhookEvent(models.Model):
         ('processed', 'Processed'),
         ('failed', 'Failed'),
         ('ignored', 'Ignored'),
+        ('dead', 'Dead'),
     ]
+
+    # Повторы с экспоненциальной задержкой: 1, 2, 4 ... минут, не больше 6 часов
+    MAX_ATTEMPTS = 8
+    RETRY_BASE_DELAY = 60
+    RETRY_MAX_DELAY = 6 * 3600
+
     provider = models.CharField(max_length=20, choices=PROVIDER_CHOICES)
-    event_id = models.CharField(max_length=255, unique=True)
+    event_id = models.CharField(max_length=255)
     event_type = models.CharField(max_length=100)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
 
@@ -194,15 +239,43 @@ class WebhookEvent(models.Model):
     error_message = models.TextField(blank=True, null=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    # Время события у провайдера (created у Stripe), ключ месячных секций таблицы
+    occurred_at = models.DateTimeField(default=timezone.now)
+    # События с одним ключом (одна подписка) обрабатываются строго по очереди
+    ordering_key = models.CharField(max_length=255, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_retry_at = models.DateTimeField(null=True, blank=True)
+
+    objects = WebhookEventQuerySet.as_manager()
 
     class Meta:
         db_table = 'webhook_events'
         verbose_name = 'Webhook Event'
         verbose_name_plural = 'Webhook Events'
         ordering = ['-created_at']
+        constraints = [
+            # Уникальный индекс секционированной таблицы включает ключ секционирования
+            models.UniqueConstraint(
+                fields=['event_id', 'occurred_at'],
+                name='webhook_events_event_id_uniq'
+            ),
+        ]
         indexes = [
             models.Index(fields=['provider', 'event_type']),
             models.Index(fields=['status']),
+            # Очередь незавершенных событий по ключу упорядочивания:
+            # неудачное событие остается в очереди и блокирует следующие
+            models.Index(
+                fields=['ordering_key', 'occurred_at', 'id'],
+                name='webhook_events_queue_idx',
+                condition=models.Q(status__in=['pending', 'failed']),
+            ),
+            # Неудачные события, у которых подошло время повтора
+            models.Index(
+                fields=['next_retry_at'],
+                name='webhook_events_retry_idx',
+                condition=models.Q(status='failed'),
+            ),
         ]
     
     def __str__(self):
@@ -213,12 +286,29 @@ class WebhookEvent(models.Model):
         from django.utils import timezone
         self.status = 'processed'
         self.processed_at = timezone.now()
+        self.next_retry_at = None
         self.save()
 
     def mark_as_failed(self, error_message):
-        """Помечает событие как неудачно обработанное"""
+        """
+        Помечает событие как неудачно обработанное и назначает повтор.
+        После MAX_ATTEMPTS попыток событие уходит в dead и больше не повторяется
+        """
         from django.utils import timezone
-        self.status = 'failed'
+        from datetime import timedelta
+        self.attempts += 1
         self.error_message = error_message
         self.processed_at = timezone.now()
-        self.save()
\ No newline at end of file
+        if self.attempts >= self.MAX_ATTEMPTS:
+            self.status = 'dead'
+            self.next_retry_at = None
+        else:
+            self.status = 'failed'
+            self.next_retry_at = self.processed_at + timedelta(seconds=self.retry_delay(self.attempts))
+        self.save()
+
+    @classmethod
+    def retry_delay(cls, attempts):
+        """Задержка перед повтором: экспонента с джиттером, чтобы повторы не шли волной"""
+        delay = min(cls.RETRY_MAX_DELAY, cls.RETRY_BASE_DELAY * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
\ No newline at end of file
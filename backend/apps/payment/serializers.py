@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from decimal import Decimal
 from .models import Payment, PaymentAttempt, WebhookEvent, Refund
+from apps.subscribe.services import EntitlementService
 
 
 class PaymentSerializer(serializers.ModelSerializer):
@@ -71,7 +72,7 @@ class PaymentCreateSerializer(serializers.Serializer):
         user = self.context['request'].user
 
         #Проверяем нет ли уже активная подписка
-        if hasattr(user, 'subscription') and user.subscription.is_active:
+        if EntitlementService.get(user).is_active:
             raise serializers.ValidationError({
                 'non_field_errors': ['User already has an active subscription.']
             })
@@ -1,12 +1,15 @@
-import stripe
 from django.conf import settings
 from django.utils import timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal
 from typing import Dict, Optional, Tuple
 import logging
+import uuid
 
 from .models import Payment, PaymentAttempt, WebhookEvent
-from apps.subscribe.models import Subscription, SubscriptionPlan, SubscriptionHistory
+from .stripe_client import stripe
+from apps.subscribe import history
+from apps.subscribe.models import Subscription, SubscriptionPlan
 
 logger = logging.getLogger(__name__)
 
@@ -15,14 +18,12 @@ if not settings.STRIPE_SECRET_KEY:
     logger.error("STRIPE_SECRET_KEY is not configured")
     raise ValueError("STRIPE_SECRET_KEY is required")
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
-
 
 class StripeService:
     """Сервис для работы с stripe"""
     
     @staticmethod
-    def create_customer(user) -> Optional[str]:
+    def create_customer(user, idempotency_key: Optional[str] = None) -> Optional[str]:
         """Создает клиента в stripe"""
         try:
             customer = stripe.Customer.create(
@@ -31,31 +32,81 @@ class StripeService:
                 metadata={
                     'user_id': user.id,
                     'username': user.username
-                }
+                },
+                idempotency_key=idempotency_key
             )
             return customer.id
+        except stripe.error.IdempotencyError as e:
+            # Ключ уже использован с другими параметрами (например, сменился email)
+            logger.error(f"Idempotency key {idempotency_key} reused for Stripe customer of user {user.id}: {e}")
+            return None
         except stripe.error.StripeError as e:
             logger.error(f"Error creating Stripe customer: {e}")
             return None
         except Exception as e:
             logger.error(f"Unexpected error creating Stripe customer: {e}")
             return None
+
+    @staticmethod
+    def get_or_create_customer(user) -> Optional[str]:
+        """
+        Клиент Stripe пользователя: создается один раз и хранится в user.stripe_customer_id.
+        Ключ идемпотентности свой у каждой попытки (повторы внутри вызова
+        библиотека шлет с тем же ключом). Сохраняет клиента условный UPDATE:
+        если параллельный запрос успел раньше, созданный дубль удаляется
+        """
+        from django.contrib.auth import get_user_model
+
+        if user.stripe_customer_id:
+            return user.stripe_customer_id
+
+        User = get_user_model()
+        customer_id = User.objects.filter(pk=user.pk).values_list('stripe_customer_id', flat=True).first()
+        if not customer_id:
+            customer_id = StripeService.create_customer(
+                user, idempotency_key=f'customer-user-{user.pk}-{uuid.uuid4().hex}'
+            )
+            if not customer_id:
+                return None
+            updated = User.objects.filter(pk=user.pk, stripe_customer_id__isnull=True).update(
+                stripe_customer_id=customer_id
+            )
+            if not updated:
+                # Другой запрос успел сохранить клиента раньше
+                StripeService.delete_customer(customer_id)
+                customer_id = User.objects.filter(pk=user.pk).values_list('stripe_customer_id', flat=True).get()
+
+        user.stripe_customer_id = customer_id
+        return customer_id
         
+    @staticmethod
+    def delete_customer(customer_id: str) -> bool:
+        """Удаляет клиента в Stripe, ошибка только логируется"""
+        try:
+            stripe.Customer.delete(customer_id)
+            return True
+        except stripe.error.StripeError as e:
+            logger.warning(f"Failed to delete Stripe customer {customer_id}: {e}")
+            return False
+
     @staticmethod
     def create_checkout_session(payment: Payment, success_url: str, cancel_url: str) -> Optional[Dict]:
-        """Создает сессию Stripe Checkout"""
+        """
+        Создает сессию Stripe Checkout для уже сохраненного платежа.
+        Вызывается вне транзакции: запросы к Stripe не держат соединение
+        и блокировки, результат записывается одним коротким UPDATE.
+        Ключ идемпотентности checkout-{payment.id}: повтор для того же
+        платежа вернет ту же сессию
+        """
         try:
-            if not payment.stripe_customer_id:
-                customer_id = StripeService.create_customer(payment.user)
-                if not customer_id:
-                    logger.error(f"Failed to create Stripe customer for user {payment.user.id}")
-                    payment.mark_as_failed("Failed to create Stripe customer")
-                    return None
-                payment.stripe_customer_id = customer_id
-                payment.save()
+            customer_id = payment.stripe_customer_id or StripeService.get_or_create_customer(payment.user)
+            if not customer_id:
+                logger.error(f"Failed to create Stripe customer for user {payment.user.id}")
+                payment.mark_as_failed("Failed to create Stripe customer")
+                return None
 
             session = stripe.checkout.Session.create(
-                customer=payment.stripe_customer_id,
+                customer=customer_id,
                 payment_method_types=['card'],
                 line_items=[{   
                     'price_data': {
@@ -75,13 +126,24 @@ class StripeService:
                     'payment_id': payment.id,
                     'user_id': payment.user.id,
                     'subscription_id': payment.subscription.id,
-                }
+                },
+                idempotency_key=f'checkout-{payment.id}'
             )
 
-            #Обновляем платеж
+            #Обновляем платеж, если его не успели отменить
+            finalized = Payment.objects.filter(pk=payment.pk, status='pending').update(
+                stripe_customer_id=customer_id,
+                stripe_session_id=session.id,
+                status='processing',
+                updated_at=timezone.now()
+            )
+            if not finalized:
+                logger.warning(f"Payment {payment.id} is no longer pending, checkout session {session.id} not attached")
+                return None
+
+            payment.stripe_customer_id = customer_id
             payment.stripe_session_id = session.id
             payment.status = 'processing'
-            payment.save()
 
             return {
                 'checkout_url': session.url,
@@ -102,6 +164,9 @@ class StripeService:
     def create_payment_intent(payment: Payment) -> Optional[str]:
         """Создает payment intent в Stripe"""
         try:
+            if not payment.stripe_customer_id:
+                payment.stripe_customer_id = StripeService.get_or_create_customer(payment.user)
+
             intent = stripe.PaymentIntent.create(
                 amount=int(payment.amount * 100), #в центах
                 currency=payment.currency.lower(),
@@ -155,6 +220,7 @@ class StripeService:
             session = stripe.checkout.Session.retrieve(session_id)
             return { 
                 'status': session.payment_status,
+                'session_status': session.status,
                 'payment_intent': session.payment_intent,
                 'customer': session.customer,
                 'metadata': session.metadata
@@ -166,6 +232,9 @@ class StripeService:
 
 class PaymentService:
     """Основной класс для работы с платежами""" 
+    # Незавершенный checkout старше этого времени проверяет сверка
+    CHECKOUT_STALE_AFTER = timedelta(minutes=15)
+
     @staticmethod
     def create_subscription_payment(user, plan: SubscriptionPlan) -> Tuple[Payment, Subscription]:
         """Создает платеж для подписки"""
@@ -180,15 +249,13 @@ class PaymentService:
             subscription.status = 'pending'
             subscription.start_date = timezone.now()
             subscription.end_date = timezone.now()  # Будет обновлено после оплаты
+            # Запись renewed в журнал делает сигнал смены статуса
+            subscription._history_note = {
+                'description': f'Subscription renewed for plan {plan.name}',
+                'metadata': {'plan_name': plan.name}
+            }
             subscription.save()
         
-            # Записываем в историю
-            SubscriptionHistory.objects.create(
-                subscription=subscription,
-                action='renewed',
-                description=f'Subscription renewed for plan {plan.name}'
-            )
-        
         except Subscription.DoesNotExist:
             # Создаем новую подписку
             subscription = Subscription.objects.create(
@@ -198,13 +265,6 @@ class PaymentService:
                 start_date=timezone.now(),
                 end_date=timezone.now()  # Будет обновлено после оплаты
             )
-        
-            # Записываем в историю
-            SubscriptionHistory.objects.create(
-                subscription=subscription,
-                action='created',
-                description=f'Subscription created for plan {plan.name}'
-            )
 
         # Создаем платеж
         payment = Payment.objects.create(
@@ -220,21 +280,36 @@ class PaymentService:
     
     @staticmethod
     def process_successful_payment(payment: Payment) -> bool:
-        """Обрабатывает успешный платеж"""
-        try:
-            payment.mark_as_succeeded()
+        """
+        Обрабатывает успешный платеж. Переход в succeeded захватывается условным UPDATE,
+        поэтому webhook, сверка и payment_status не проводят один платеж дважды
+        """
+        from django.db import transaction
 
-            #Активируем подписку
-            if payment.subscription:
-                payment.subscription.activate()
-
-                #Записываем в историю
-                SubscriptionHistory.objects.create(
-                        subscription=payment.subscription,
-                        action='activated',
-                        description='Subscription activated after successful payment',
-                        metadata={'payment_id': payment.id}
-                )
+        try:
+            with transaction.atomic():
+                now = timezone.now()
+                claimed = Payment.objects.filter(
+                    pk=payment.pk,
+                    status__in=['pending', 'processing']
+                ).update(status='succeeded', processed_at=now, updated_at=now)
+
+                if not claimed:
+                    # Платеж уже проведен (или отменен) другим обработчиком
+                    payment.refresh_from_db(fields=['status', 'processed_at', 'updated_at'])
+                    logger.info(f"Payment {payment.id} already settled as {payment.status}")
+                    return payment.status == 'succeeded'
+
+                payment.status = 'succeeded'
+                payment.processed_at = payment.updated_at = now
+
+                #Активируем подписку, запись activated в журнал делает сигнал смены статуса
+                if payment.subscription:
+                    payment.subscription._history_note = {
+                        'description': 'Subscription activated after successful payment',
+                        'metadata': {'payment_id': payment.id}
+                    }
+                    payment.subscription.activate()
 
             logger.info(f"Payment {payment.id} processed successfully")
             return True
@@ -253,7 +328,7 @@ class PaymentService:
             if payment.subscription:
                 payment.subscription.deactivate()
 
-                SubscriptionHistory.objects.create(
+                history.record(
                     subscription=payment.subscription,
                     action='payment_failed',
                     description=f'payment failed: {reason}',
@@ -265,21 +340,66 @@ class PaymentService:
             logger.error(f"Error processing failed payment {payment.id}: {e}")
             return False
         
+    @staticmethod
+    def reconcile_checkouts(batch_size: int = 100) -> Dict:
+        """
+        Доводит до конца брошенные попытки checkout:
+        pending без сессии (процесс упал между фазами) отменяются,
+        processing сверяются со Stripe - оплаченные проводятся, истекшие отменяются.
+        Запросы к Stripe идут вне транзакций
+        """
+        from django.db import transaction
+
+        now = timezone.now()
+        cutoff = now - PaymentService.CHECKOUT_STALE_AFTER
+
+        abandoned = Payment.objects.filter(
+            status='pending',
+            payment_method='stripe',
+            stripe_session_id__isnull=True,
+            created_at__lt=cutoff
+        ).update(status='cancelled', updated_at=now)
+
+        completed = expired = 0
+        stale = Payment.objects.filter(
+            status='processing',
+            stripe_session_id__isnull=False,
+            updated_at__lt=cutoff
+        ).select_related('subscription').order_by('updated_at')[:batch_size]
+
+        for payment in stale:
+            session_info = StripeService.retrieve_session(payment.stripe_session_id)
+            if session_info is None:
+                continue
+
+            if session_info['status'] == 'paid':
+                with transaction.atomic():
+                    if PaymentService.process_successful_payment(payment):
+                        completed += 1
+            elif session_info['session_status'] == 'expired':
+                expired += Payment.objects.filter(pk=payment.pk, status='processing').update(
+                    status='cancelled', updated_at=timezone.now()
+                )
+            else:
+                # Сессия еще открыта: переносим платеж в конец очереди сверки
+                Payment.objects.filter(pk=payment.pk, status='processing').update(updated_at=timezone.now())
+
+        return {
+            'abandoned_payments': abandoned,
+            'completed_payments': completed,
+            'expired_payments': expired
+        }
+
     @staticmethod
     def cancel_subscription(subscription: Subscription) -> bool:
         """Отменяет подписку"""
         try:
+            subscription._history_note = {'description': 'Subscription cancelled by user'}
             subscription.cancel()
             
             #Удаляем закрепленный пост если есть
             if hasattr(subscription.user, 'pinned_post'):
                 subscription.user.pinned_post.delete()
-
-                SubscriptionHistory.objects.create(
-                    subscription=subscription,
-                    action='cancelled',
-                    description='Subscription cancelled by user'
-                )
             
             logger.info(f"Subscription {subscription.id} cancelled")
             return True
@@ -290,51 +410,166 @@ class PaymentService:
 class WebhookService:
     """Сервис для обработки webhook событий"""
     @staticmethod
-    def process_stripe_webhook(event_data: Dict) -> bool:
-        """Обрабатывает stripe webhook"""
+    def event_time(event_data: Dict) -> Optional[datetime]:
+        """
+        Время создания события у Stripe: неизменно при повторной доставке
+        и входит в ключ дедупликации. None, если created нет или он некорректен
+        """
         try:
-            event_id = event_data.get('id')
-            event_type = event_data.get('type')
+            return datetime.fromtimestamp(int(event_data['created']), tz=dt_timezone.utc)
+        except (KeyError, TypeError, ValueError, OverflowError):
+            return None
 
-            #Проверяем не обрабатывали ли мы это событие
-            if WebhookEvent.objects.filter(event_id=event_id).exists():
-                return True
-            
-            #Создаем запись о событии
-            webhook_event = WebhookEvent.objects.create(
-                provider='stripe',
-                event_id=event_id,
-                event_type=event_type,
-                data=event_data
+    @staticmethod
+    def ordering_key(event_data: Dict) -> str:
+        """
+        Ключ упорядочивания: события одной подписки обрабатываются по очереди,
+        события без подписки - по клиенту Stripe или независимо
+        """
+        event_object = (event_data.get('data') or {}).get('object') or {}
+        metadata = event_object.get('metadata') or {}
+        if metadata.get('subscription_id'):
+            return f"subscription:{metadata['subscription_id']}"
+        if event_object.get('customer'):
+            return f"customer:{event_object['customer']}"
+        return f"event:{event_data.get('id')}"
+
+    @staticmethod
+    def enqueue_stripe_webhook(event_data: Dict) -> Optional[WebhookEvent]:
+        """
+        Сохраняет событие одной вставкой и ставит обработку в очередь.
+        Повторная доставка того же события и событие без created возвращают None
+        """
+        from django.db import transaction
+        from .tasks import process_webhook_events
+
+        occurred_at = WebhookService.event_time(event_data)
+        if occurred_at is None:
+            # Без created повторную доставку нельзя распознать как дубль
+            logger.error(f"Stripe webhook {event_data.get('id')} has no valid created time, skipped")
+            return None
+
+        # Проверка дубля и вставка - один запрос без гонки между ними
+        webhook_event = WebhookEvent.objects.create_if_new(
+            provider='stripe',
+            event_id=event_data.get('id'),
+            event_type=event_data.get('type'),
+            data=event_data,
+            occurred_at=occurred_at,
+            ordering_key=WebhookService.ordering_key(event_data)
+        )
+        if webhook_event is None:
+            return None
+
+        ordering_key = webhook_event.ordering_key
+        transaction.on_commit(lambda: process_webhook_events.delay(ordering_key))
+        return webhook_event
+
+    @staticmethod
+    def requeue_due_retries(batch_size: int = 500) -> list:
+        """
+        Возвращает в очередь неудачные события с наступившим next_retry_at
+        (по индексу webhook_events_retry_idx) и отдает их ключи.
+        SKIP LOCKED позволяет запускать повтор с нескольких воркеров
+        """
+        from django.db import connection, transaction
+
+        table = WebhookEvent._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH due AS (
+                    SELECT id, occurred_at FROM {table}
+                    WHERE status = 'failed' AND next_retry_at <= %s
+                    ORDER BY next_retry_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                UPDATE {table} AS event SET status = 'pending'
+                FROM due
+                WHERE event.id = due.id AND event.occurred_at = due.occurred_at
+                RETURNING event.ordering_key
+                """,
+                [timezone.now(), batch_size]
             )
+            return sorted({ordering_key for ordering_key, in cursor.fetchall()})
 
-            #Обрабатываем различные типы событий
-            success = False
+    @staticmethod
+    def process_pending(ordering_key: str) -> Optional[int]:
+        """
+        Обрабатывает необработанные события одного ключа по порядку (occurred_at, id).
+        Ключ захватывается advisory lock, поэтому параллельные воркеры
+        не обрабатывают события одной подписки одновременно.
+        Неудачное событие блокирует ключ: следующие события ждут его повтора.
+        Возвращает число обработанных событий или None, если ключ занят
+        """
+        from django.db import connection
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_try_advisory_lock(hashtextextended(%s, 0))',
+                [f'webhook:{ordering_key}']
+            )
+            (locked,) = cursor.fetchone()
+        if not locked:
+            return None
 
-            if event_type == 'checkout.session.completed':
-                success = WebhookService._handle_checkout_completed(event_data)
-            elif event_type == 'payment_intent.succeeded':
-                success = WebhookService._handle_payment_succeeded(event_data)
-            elif event_type == 'payment_intent.payment_failed':
-                success = WebhookService._handle_payment_failed(event_data)
-            elif event_type == 'charge.dispute.created':
-                success = WebhookService._handle_dispute_created(event_data)
-            else:
-                #Неизвестный тип события - помечаем как игнорируемый
-                webhook_event.status = 'ignored'
-                webhook_event.save()
-                return True
-            
-            if success:
-                webhook_event.mark_as_processed()
-            else: 
-                webhook_event.mark_as_failed("Processing failed")
+        processed = 0
+        try:
+            while True:
+                # Первое незавершенное событие ключа, включая ожидающие повтора
+                webhook_event = WebhookEvent.objects.filter(
+                    ordering_key=ordering_key, status__in=['pending', 'failed']
+                ).order_by('occurred_at', 'id').first()
+                if webhook_event is None or webhook_event.status == 'failed':
+                    return processed
+                WebhookService.handle_event(webhook_event)
+                if webhook_event.status == 'failed':
+                    # До повтора по расписанию следующие события ждут,
+                    # dead-событие ключ уже не блокирует
+                    return processed
+                processed += 1
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT pg_advisory_unlock(hashtextextended(%s, 0))',
+                    [f'webhook:{ordering_key}']
+                )
 
-            return success
-        
+    @staticmethod
+    def handle_event(webhook_event: WebhookEvent) -> bool:
+        """Обрабатывает сохраненное событие и записывает результат"""
+        from django.db import transaction
+
+        handlers = {
+            'checkout.session.completed': WebhookService._handle_checkout_completed,
+            'payment_intent.succeeded': WebhookService._handle_payment_succeeded,
+            'payment_intent.payment_failed': WebhookService._handle_payment_failed,
+            'charge.dispute.created': WebhookService._handle_dispute_created,
+        }
+        handler = handlers.get(webhook_event.event_type)
+        if handler is None:
+            #Неизвестный тип события - помечаем как игнорируемый
+            webhook_event.status = 'ignored'
+            webhook_event.processed_at = timezone.now()
+            webhook_event.save(update_fields=['status', 'processed_at'])
+            return True
+
+        error_message = "Processing failed"
+        try:
+            with transaction.atomic():
+                success = handler(webhook_event.data)
         except Exception as e:
-            logger.error(f"Error processing stripe webhook: {e}")
-            return False
+            logger.error(f"Error processing stripe webhook {webhook_event.event_id}: {e}")
+            error_message = str(e)
+            success = False
+
+        if success:
+            webhook_event.mark_as_processed()
+        else:
+            # Повтор назначается с задержкой, после MAX_ATTEMPTS событие становится dead
+            webhook_event.mark_as_failed(error_message)
+        return success
         
     @staticmethod
     def _handle_checkout_completed(event_data: Dict) -> bool:
@@ -369,7 +604,8 @@ class WebhookService:
             
             payment = Payment.objects.get(id=payment_id)
             payment.stripe_payment_intent_id = payment_intent['id']
-            payment.save()
+            # Только свое поле: полный save() вернул бы статус, прочитанный до проведения
+            payment.save(update_fields=['stripe_payment_intent_id', 'updated_at'])
 
             return PaymentService.process_successful_payment(payment)
         except Payment.DoesNotExist:
@@ -0,0 +1,38 @@
+import stripe
+from django.conf import settings
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+
+def build_http_client():
+    """
+    HTTP-клиент Stripe с общим пулом keep-alive соединений и явными таймаутами
+    (подключение, чтение). Один на процесс, потоки воркера делят пул
+    """
+    session = Session()
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.STRIPE_POOL_SIZE
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return stripe.RequestsClient(
+        timeout=(settings.STRIPE_CONNECT_TIMEOUT, settings.STRIPE_READ_TIMEOUT),
+        session=session
+    )
+
+
+def configure_stripe():
+    """
+    Настраивает модуль stripe для всего проекта. Повторы сетевых ошибок
+    и ответов 409/5xx делает сама библиотека с экспоненциальной задержкой,
+    POST-запросы при этом получают ключ идемпотентности
+    """
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    stripe.api_base = settings.STRIPE_API_BASE
+    stripe.max_network_retries = settings.STRIPE_MAX_NETWORK_RETRIES
+    stripe.default_http_client = build_http_client()
+    return stripe
+
+
+configure_stripe()
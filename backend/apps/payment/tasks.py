@@ -1,6 +1,7 @@
-from celery import shared_task
+from celery import group, shared_task
 from django.utils import timezone
 from datetime import timedelta
+from apps.partitions import maintain_partitions
 from .models import Payment, WebhookEvent
 
 
@@ -19,40 +20,57 @@ def cleanup_old_payments():
 
     return {'deleted_payments': deleted_payments}
 
+@shared_task
+def reconcile_checkout_payments():
+    """Сверка незавершенных попыток checkout со Stripe"""
+    from .services import PaymentService
+
+    return PaymentService.reconcile_checkouts()
+
 @shared_task
 def cleanup_old_webhooks():
-    """Очистка старых вебхуков"""
-    cutoff_date = timezone.now() - timedelta(days=30)
+    """Очистка старых вебхуков: удаляются месячные секции старше срока хранения"""
+    return maintain_partitions('webhook_events')
 
-    #Удаляем старые обработанные события
-    old_events = WebhookEvent.objects.filter(
-        created_at__lt=cutoff_date,
-        status__in=['processed', 'ignored']
-    )
+@shared_task
+def retry_failed_webhook_events(batch_size=500):
+    """
+    Повторная обработка неудачных webhook событий, у которых подошло время повтора.
+    События возвращаются в очередь своего ключа, ключи обрабатываются
+    параллельно группой подзадач
+    """
+    from .services import WebhookService
 
-    deleted_events, _ = old_events.delete()
+    ordering_keys = WebhookService.requeue_due_retries(batch_size)
+    if ordering_keys:
+        group(process_webhook_events.s(ordering_key) for ordering_key in ordering_keys).apply_async()
 
-    return {'deleted_events': deleted_events}
+    return {'requeued_keys': len(ordering_keys)}
 
 @shared_task
-def retry_failed_webhook_events():
-    """Повторная обработка неудачных webhook событий"""
+def process_webhook_events(ordering_key):
+    """Обработка сохраненных webhook событий одного ключа по порядку"""
     from .services import WebhookService
 
-    #Находим события, Которые не удалось обработать в последние 24 часа
-    retry_cutoff = timezone.now() - timedelta(hours=24)
-
-    failed_events = WebhookEvent.objects.filter(
-        status='failed',
-        created_at__gte=retry_cutoff
-    )[:50] #Ограничиваем количество для повторной обработки
+    processed = WebhookService.process_pending(ordering_key)
+    if processed is None:
+        # Ключ обрабатывает другой воркер: проверяем позже, чтобы событие не зависло
+        process_webhook_events.apply_async((ordering_key,), countdown=5)
+        return {'processed_events': 0}
 
-    processed_count = 0
+    return {'processed_events': processed}
 
-    for event in failed_events:
-        success = WebhookService.process_stripe_webhook(event.data)
-        if success:
-            event.mark_as_processed()
-            processed_count += 1
+@shared_task
+def process_pending_webhook_events():
+    """Подстраховка: ставит в очередь ключи с необработанными событиями (например, потерянные задачи)"""
+    cutoff = timezone.now() - timedelta(minutes=1)
+    ordering_keys = list(
+        WebhookEvent.objects.filter(
+            status='pending',
+            created_at__lt=cutoff
+        ).order_by().values_list('ordering_key', flat=True).distinct()
+    )
+    for ordering_key in ordering_keys:
+        process_webhook_events.delay(ordering_key)
 
-    return {'reprocessed_events': processed_count}
\ No newline at end of file
+    return {'queued_keys': len(ordering_keys)}
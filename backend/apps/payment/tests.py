@@ -1,3 +1,119 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from apps.subscribe.models import Subscription, SubscriptionHistory, SubscriptionPlan
+
+from .models import Payment, WebhookEvent
+from .services import PaymentService, WebhookService
+
+
+class WebhookOrderingTests(TestCase):
+    """События одной подписки применяются по порядку, в том числе при повторах"""
+
+    ordering_key = 'subscription:1'
+
+    def create_event(self, event_type, created):
+        event_data = {
+            'id': f'evt_{created}',
+            'type': event_type,
+            'created': created,
+            'data': {'object': {'metadata': {'subscription_id': '1', 'payment_id': '1'}}},
+        }
+        return WebhookEvent.objects.create_if_new(
+            provider='stripe',
+            event_id=event_data['id'],
+            event_type=event_type,
+            data=event_data,
+            occurred_at=WebhookService.event_time(event_data),
+            ordering_key=WebhookService.ordering_key(event_data),
+        )
+
+    def retry_now(self, webhook_event):
+        WebhookEvent.objects.filter(pk=webhook_event.pk).update(next_retry_at=timezone.now())
+        self.assertEqual(WebhookService.requeue_due_retries(), [self.ordering_key])
+
+    @mock.patch.object(WebhookService, '_handle_checkout_completed', side_effect=[False, True])
+    def test_failed_event_blocks_later_events(self, handler):
+        first = self.create_event('checkout.session.completed', 1_700_000_000)
+        self.assertEqual(WebhookService.process_pending(self.ordering_key), 0)
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'failed')
+
+        # Более позднее событие той же подписки не обгоняет ожидающее повтора
+        second = self.create_event('charge.dispute.created', 1_700_000_001)
+        self.assertEqual(WebhookService.process_pending(self.ordering_key), 0)
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'pending')
+
+        self.retry_now(first)
+        self.assertEqual(WebhookService.process_pending(self.ordering_key), 2)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), ('processed', 'processed'))
+        self.assertLessEqual(first.processed_at, second.processed_at)
+
+    @mock.patch.object(WebhookService, '_handle_checkout_completed', return_value=False)
+    def test_dead_event_releases_key(self, handler):
+        first = self.create_event('checkout.session.completed', 1_700_000_000)
+        second = self.create_event('charge.dispute.created', 1_700_000_001)
+        WebhookEvent.objects.filter(pk=first.pk).update(attempts=WebhookEvent.MAX_ATTEMPTS - 1)
+
+        self.assertEqual(WebhookService.process_pending(self.ordering_key), 2)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), ('dead', 'processed'))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SuccessfulPaymentTests(TestCase):
+    """Успешный платеж проводится один раз, сколько бы обработчиков его ни увидели"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user(
+            username='buyer', email='buyer@example.com', password='password'
+        )
+        plan = SubscriptionPlan.objects.create(
+            name='Monthly', price=Decimal('9.99'), duration_days=30, stripe_price_id='price_monthly'
+        )
+        now = timezone.now()
+        cls.subscription = Subscription.objects.create(
+            user=user, plan=plan, status='pending', start_date=now, end_date=now + timedelta(days=30)
+        )
+        cls.payment = Payment.objects.create(
+            user=user,
+            subscription=cls.subscription,
+            amount=plan.price,
+            status='processing',
+            payment_method='stripe'
+        )
+
+    def test_same_payment_processed_twice(self):
+        # Две копии, загруженные до проведения: webhook и payment_status одновременно
+        first = Payment.objects.get(pk=self.payment.pk)
+        second = Payment.objects.get(pk=self.payment.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(PaymentService.process_successful_payment(first))
+        self.subscription.refresh_from_db()
+        end_date = self.subscription.end_date
+        history_count = SubscriptionHistory.objects.filter(subscription=self.subscription).count()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(PaymentService.process_successful_payment(second))
+        self.subscription.refresh_from_db()
+
+        self.assertEqual(self.subscription.status, 'active')
+        self.assertEqual(self.subscription.end_date, end_date)
+        self.assertEqual(second.status, 'succeeded')
+        self.assertEqual(
+            SubscriptionHistory.objects.filter(subscription=self.subscription).count(), history_count
+        )
+        activated = SubscriptionHistory.objects.get(subscription=self.subscription, action='activated')
+        self.assertEqual(activated.metadata['payment_id'], self.payment.pk)
+        self.assertEqual(activated.description, 'Subscription activated after successful payment')
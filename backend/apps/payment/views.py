@@ -52,10 +52,16 @@ class PaymentDetailView(generics.RetrieveAPIView):
             user=self.request.user
         ).select_related('subscription', 'subscription__plan').order_by('-created_at')
 
+@transaction.non_atomic_requests
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def create_checkout_session(request):
-    """Создает stripe checkout session для оплаты подписки"""
+    """
+    Создает stripe checkout session для оплаты подписки.
+    Двухфазно: платеж фиксируется коротким коммитом, Stripe вызывается
+    без открытой транзакции, результат записывается отдельным UPDATE.
+    Брошенные попытки доводит до конца reconcile_checkout_payments
+    """
     import logging
     logger = logging.getLogger(__name__)
     
@@ -78,42 +84,42 @@ def create_checkout_session(request):
     logger.info(f"Serializer validated data: {serializer.validated_data}")
 
     try:
-        with transaction.atomic():
-            plan_id = serializer.validated_data['subscription_plan_id']
-            plan = get_object_or_404(SubscriptionPlan, id=plan_id, is_active=True)
-            
-            logger.info(f"Found plan: {plan.id} - {plan.name}")
+        plan_id = serializer.validated_data['subscription_plan_id']
+        plan = get_object_or_404(SubscriptionPlan, id=plan_id, is_active=True)
+        
+        logger.info(f"Found plan: {plan.id} - {plan.name}")
 
-            # Создаем платеж и подписку
+        # Фаза 1: создаем платеж и подписку и сразу коммитим
+        with transaction.atomic():
             payment, subscription = PaymentService.create_subscription_payment(request.user, plan)
-            
-            logger.info(f"Created payment: {payment.id}, subscription: {subscription.id}")
+        
+        logger.info(f"Created payment: {payment.id}, subscription: {subscription.id}")
 
-            # Получаем URLs из запроса
-            success_url = serializer.validated_data.get(
-                'success_url',
-                f"{settings.FRONTEND_URL}/subscription/success?session_id={{CHECKOUT_SESSION_ID}}"
-            )
-            cancel_url = serializer.validated_data.get(
-                'cancel_url',
-                f"{settings.FRONTEND_URL}/subscription/cancel"
-            )
-            
-            logger.info(f"Success URL: {success_url}")
-            logger.info(f"Cancel URL: {cancel_url}")
+        # Получаем URLs из запроса
+        success_url = serializer.validated_data.get(
+            'success_url',
+            f"{settings.FRONTEND_URL}/subscription/success?session_id={{CHECKOUT_SESSION_ID}}"
+        )
+        cancel_url = serializer.validated_data.get(
+            'cancel_url',
+            f"{settings.FRONTEND_URL}/subscription/cancel"
+        )
+        
+        logger.info(f"Success URL: {success_url}")
+        logger.info(f"Cancel URL: {cancel_url}")
 
-            # Создаем stripe session
-            session_data = StripeService.create_checkout_session(payment, success_url, cancel_url)
-            
-            if session_data:
-                logger.info(f"Stripe session created: {session_data}")
-                response_serializer = StripeCheckoutSessionSerializer(session_data)
-                return Response(response_serializer.data, status=status.HTTP_201_CREATED)
-            else:
-                logger.error("Failed to create Stripe session - session_data is None")
-                return Response({
-                    'error': 'Failed to create checkout session'
-                }, status=status.HTTP_400_BAD_REQUEST)
+        # Фаза 2: stripe session без открытой транзакции
+        session_data = StripeService.create_checkout_session(payment, success_url, cancel_url)
+        
+        if session_data:
+            logger.info(f"Stripe session created: {session_data}")
+            response_serializer = StripeCheckoutSessionSerializer(session_data)
+            return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+        else:
+            logger.error("Failed to create Stripe session - session_data is None")
+            return Response({
+                'error': 'Failed to create checkout session'
+            }, status=status.HTTP_400_BAD_REQUEST)
                 
     except SubscriptionPlan.DoesNotExist:
         logger.error(f"Subscription plan {plan_id} not found")
@@ -127,10 +133,11 @@ def create_checkout_session(request):
             'details': str(e)
         }, status=status.HTTP_400_BAD_REQUEST)
 
+@transaction.non_atomic_requests
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def payment_status(request, payment_id):
-    """Возвращает статус платежа"""
+    """Возвращает статус платежа (запрос к Stripe идет вне транзакции)"""
     try:
         payment = get_object_or_404(
             Payment,
@@ -142,10 +149,12 @@ def payment_status(request, payment_id):
             session_info = StripeService.retrieve_session(payment.stripe_session_id)
 
             if session_info:
-                if session_info['status'] == 'completed':
-                    PaymentService.process_successful_payment(payment)
-                elif session_info['status'] == 'failed':
-                    PaymentService.process_failed_payment(payment, 'Session_failed')
+                # status - это payment_status сессии: paid / unpaid
+                with transaction.atomic():
+                    if session_info['status'] == 'paid':
+                        PaymentService.process_successful_payment(payment)
+                    elif session_info['session_status'] == 'expired':
+                        PaymentService.process_failed_payment(payment, 'Session_expired')
             
         response_data = {
             'payment_id': payment.id,
@@ -217,10 +226,11 @@ class RefundDetailView(generics.RetrieveAPIView):
         'subscription', 'payment__user', 'created_by'
     )
 
+@transaction.non_atomic_requests
 @api_view(['POST'])
 @permission_classes([permissions.IsAdminUser])
 def create_refund(request, payment_id):
-    """Создает возврат для платежа"""
+    """Создает возврат для платежа (запрос к Stripe идет вне транзакции)"""
     try:
         payment = get_object_or_404(
             Payment, id=payment_id
@@ -250,10 +260,11 @@ def create_refund(request, payment_id):
             )
 
             if success:
-                refund.process_refund()
+                with transaction.atomic():
+                    refund.process_refund()
 
-                if refund.amount == payment.amount and payment.subscription:
-                    PaymentService.cancel_subscription(payment.subscription)
+                    if refund.amount == payment.amount and payment.subscription:
+                        PaymentService.cancel_subscription(payment.subscription)
                 
                 response_serializer = RefundSerializer(refund)
                 return Response(response_serializer.data, status=status.HTTP_201_CREATED)
@@ -289,11 +300,9 @@ def stripe_webhook(request):
         #Не верная подпись
         return HttpResponse(status=400)
     
-    success = WebhookService.process_stripe_webhook(event)  
-    if success:
-        return HttpResponse(status=200)
-    else:
-        return HttpResponse(status=400)
+    # Обработка идет в Celery, Stripe сразу получает подтверждение
+    WebhookService.enqueue_stripe_webhook(event)
+    return HttpResponse(status=200)
     
 @api_view(['GET'])
 @permission_classes([permissions.IsAdminUser])
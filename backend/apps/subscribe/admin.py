@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils import timezone
-from .models import SubscriptionPlan, Subscription, SubscriptionHistory, PinnedPost
+from .models import SubscriptionPlan, Subscription, SubscriptionHistory, PinnedPost, ExpiryReminder
 
 @admin.register(SubscriptionPlan)
 class SubscriptionPlanAdmin(admin.ModelAdmin):
@@ -205,6 +205,20 @@ class SubscriptionHistoryAdmin(admin.ModelAdmin):
         return super().get_queryset(request).select_related('subscription', 'subscription__user')
     
 
+@admin.register(ExpiryReminder)
+class ExpiryReminderAdmin(admin.ModelAdmin):
+    list_display = ('subscription', 'end_date', 'status', 'attempts', 'sent_at')
+    list_filter = ('status', 'sent_at')
+    search_fields = ('subscription__user__username', 'subscription__user__email')
+    readonly_fields = ('subscription', 'end_date', 'attempts', 'error', 'sent_at', 'created_at', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('subscription__user', 'subscription__plan')
+
+
     # Дополнительные настройки админки
 
 admin.site.site_header = "News Site Administration"
@@ -0,0 +1,84 @@
+import logging
+import threading
+
+from celery.signals import task_postrun, task_prerun
+from django.core.signals import request_finished, request_started
+from django.db import DatabaseError, transaction
+from django.dispatch import receiver
+
+from .models import SubscriptionHistory
+
+logger = logging.getLogger(__name__)
+
+
+# Журнал подписок пишется не в транзакции запроса: события копятся
+# после коммита в буфере текущего запроса или задачи и сохраняются
+# одним bulk_create, когда ответ уже отдан (request_finished) или задача
+# завершилась (task_postrun). Откаченные события в журнал не попадают.
+# Вне запроса и задачи (shell, команды) событие пишется сразу после коммита.
+# Каждое событие записывается как есть: смену статуса подписки пишет только
+# сигнал модели, сервисы передают ему подробности через _history_note.
+_state = threading.local()
+
+
+def record(subscription, action, description='', metadata=None):
+    """Добавляет событие в журнал подписки после коммита текущей транзакции"""
+    entry = SubscriptionHistory(
+        subscription_id=getattr(subscription, 'pk', subscription),
+        action=action,
+        description=description,
+        metadata=metadata or {}
+    )
+    transaction.on_commit(lambda: _collect(entry))
+
+
+def _collect(entry):
+    buffer = getattr(_state, 'buffer', None)
+    if buffer is None:
+        write([entry])
+    else:
+        buffer.append(entry)
+
+
+def begin():
+    """Начинает буфер для запроса или задачи"""
+    flush()
+    _state.buffer = []
+
+
+def flush():
+    """Сохраняет накопленные события и закрывает буфер"""
+    entries = getattr(_state, 'buffer', None)
+    _state.buffer = None
+    if entries:
+        write(entries)
+
+
+def write(entries):
+    try:
+        SubscriptionHistory.objects.bulk_create(entries)
+    except DatabaseError as e:
+        # Журнал не должен ломать запрос, который уже закоммичен
+        logger.error(f"Failed to write {len(entries)} subscription history entries: {e}")
+
+
+@receiver(request_started)
+def begin_request_history(sender, **kwargs):
+    begin()
+
+
+@receiver(request_finished)
+def flush_request_history(sender, **kwargs):
+    # Соединение, открытое здесь после close_old_connections запроса,
+    # закроет close_old_connections по request_started следующего запроса
+    flush()
+
+
+@task_prerun.connect
+def begin_task_history(**kwargs):
+    begin()
+
+
+@task_postrun.connect
+def flush_task_history(**kwargs):
+    flush()
@@ -1,10 +1,7 @@
-import stripe
 from django.core.management.base import BaseCommand
-from django.conf import settings
+from apps.payment.stripe_client import stripe
 from apps.subscribe.models import SubscriptionPlan
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
-
 
 
 class Command(BaseCommand):
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribe', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpiryReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('end_date', models.DateTimeField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('subscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expiry_reminders', to='subscribe.subscription')),
+            ],
+            options={
+                'verbose_name': 'Expiry Reminder',
+                'verbose_name_plural': 'Expiry Reminders',
+                'db_table': 'subscription_expiry_reminders',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(condition=models.Q(('status', 'sent'), _negated=True), fields=['status'], name='expiry_reminders_unsent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('subscription', 'end_date'), name='expiry_reminder_unique_end_date')],
+            },
+        ),
+    ]
@@ -0,0 +1,92 @@
+from django.db import migrations
+
+
+# Таблица пересоздается секционированной по месяцам created_at.
+# Первичный ключ включает ключ секционирования, для Django
+# первичным ключом остается id.
+PARTITION_SQL = """
+ALTER TABLE subscription_history RENAME TO subscription_history_unpartitioned;
+ALTER INDEX subscription_history_pkey RENAME TO subscription_history_unpartitioned_pkey;
+ALTER SEQUENCE subscription_history_id_seq RENAME TO subscription_history_unpartitioned_id_seq;
+DROP INDEX subscription_history_subscription_id_2785a3c8;
+
+CREATE TABLE subscription_history (
+    id bigint NOT NULL GENERATED BY DEFAULT AS IDENTITY,
+    action varchar(20) NOT NULL,
+    description text NOT NULL,
+    metadata jsonb NOT NULL,
+    created_at timestamp with time zone NOT NULL,
+    subscription_id bigint NOT NULL,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+DO $$
+DECLARE
+    month timestamp := date_trunc('month', LEAST(
+        (SELECT MIN(created_at) FROM subscription_history_unpartitioned), now()
+    ) AT TIME ZONE 'UTC');
+BEGIN
+    WHILE month <= date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months' LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF subscription_history FOR VALUES FROM (%L) TO (%L)',
+            'subscription_history_p' || to_char(month, 'YYYYMM'),
+            month AT TIME ZONE 'UTC',
+            (month + interval '1 month') AT TIME ZONE 'UTC'
+        );
+        month := month + interval '1 month';
+    END LOOP;
+END $$;
+CREATE TABLE subscription_history_default PARTITION OF subscription_history DEFAULT;
+
+INSERT INTO subscription_history (id, action, description, metadata, created_at, subscription_id)
+SELECT id, action, description, metadata, created_at, subscription_id
+FROM subscription_history_unpartitioned;
+SELECT setval(pg_get_serial_sequence('subscription_history', 'id'), COALESCE(MAX(id), 0) + 1, false)
+FROM subscription_history;
+DROP TABLE subscription_history_unpartitioned;
+
+ALTER TABLE subscription_history
+    ADD CONSTRAINT subscription_history_subscription_id_2785a3c8_fk_subscript
+    FOREIGN KEY (subscription_id) REFERENCES subscriptions (id) DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX subscription_history_subscription_id_2785a3c8 ON subscription_history (subscription_id);
+"""
+
+UNPARTITION_SQL = """
+ALTER TABLE subscription_history RENAME TO subscription_history_partitioned;
+ALTER INDEX subscription_history_pkey RENAME TO subscription_history_partitioned_pkey;
+ALTER SEQUENCE subscription_history_id_seq RENAME TO subscription_history_partitioned_id_seq;
+DROP INDEX subscription_history_subscription_id_2785a3c8;
+ALTER TABLE subscription_history_partitioned
+    DROP CONSTRAINT subscription_history_subscription_id_2785a3c8_fk_subscript;
+
+CREATE TABLE subscription_history (
+    id bigint NOT NULL PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+    action varchar(20) NOT NULL,
+    description text NOT NULL,
+    metadata jsonb NOT NULL,
+    created_at timestamp with time zone NOT NULL,
+    subscription_id bigint NOT NULL
+);
+INSERT INTO subscription_history (id, action, description, metadata, created_at, subscription_id)
+SELECT id, action, description, metadata, created_at, subscription_id
+FROM subscription_history_partitioned;
+SELECT setval(pg_get_serial_sequence('subscription_history', 'id'), COALESCE(MAX(id), 0) + 1, false)
+FROM subscription_history;
+DROP TABLE subscription_history_partitioned;
+
+ALTER TABLE subscription_history
+    ADD CONSTRAINT subscription_history_subscription_id_2785a3c8_fk_subscript
+    FOREIGN KEY (subscription_id) REFERENCES subscriptions (id) DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX subscription_history_subscription_id_2785a3c8 ON subscription_history (subscription_id);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribe', '0002_expiryreminder'),
+    ]
+
+    operations = [
+        migrations.RunSQL(PARTITION_SQL, UNPARTITION_SQL),
+    ]
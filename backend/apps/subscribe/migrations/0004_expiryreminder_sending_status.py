@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribe', '0003_subscription_history_partitioning'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='expiryreminder',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_post_comments_updated_at'),
+        ('subscribe', '0004_expiryreminder_sending_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pinnedpost',
+            name='active_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        # Существующие закрепы: до конца активной подписки владельца
+        migrations.RunSQL(
+            """
+            UPDATE pinned_posts SET active_until = subscriptions.end_date
+            FROM subscriptions
+            WHERE subscriptions.user_id = pinned_posts.user_id AND subscriptions.status = 'active'
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='pinnedpost',
+            index=models.Index(fields=['active_until'], name='pinned_post_active__efe973_idx'),
+        ),
+    ]
@@ -65,10 +65,13 @@ class Subscription(models.Model):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._previous_status = self.status if self.pk else None
+        # Описание и метаданные для записи журнала о смене статуса при следующем save()
+        self._history_note = None
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
         self._previous_status = self.status
+        self._history_note = None
         
     @property
     def is_active(self):
@@ -127,6 +130,9 @@ class PinnedPost(models.Model):
         related_name='pin_info'
     )
     pinned_at = models.DateTimeField(auto_now_add=True)
+    # Окончание активной подписки владельца (NULL - подписка неактивна):
+    # лента сортирует закрепы по одной таблице, без соединения с подписками
+    active_until = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         db_table = 'pinned_posts'
@@ -135,6 +141,7 @@ class PinnedPost(models.Model):
         ordering = ['-pinned_at']
         indexes = [
             models.Index(fields=['pinned_at']),
+            models.Index(fields=['active_until']),
         ]
 
     def __str__(self):
@@ -144,8 +151,11 @@ class PinnedPost(models.Model):
         from django.db import transaction
         with transaction.atomic():
             user = type(self.user).objects.select_for_update().get(pk=self.user.pk)
-            if not hasattr(self.user, 'subscription') or not self.user.subscription.is_active:
+            from .services import EntitlementService
+            entitlement = EntitlementService.get(self.user)
+            if not entitlement.can_pin_posts:
                 raise ValueError("User must have an active subscription to pin posts.")
+            self.active_until = entitlement.end_date
             
             if self.post.author != self.user:
                 raise ValueError("Users can only pin their own posts.")
@@ -181,4 +191,52 @@ class SubscriptionHistory(models.Model):
     def __str__(self):
         return f"{self.subscription.user.username} - {self.action}"
         
-        
\ No newline at end of file
+        
+class ExpiryReminder(models.Model):
+    """
+    Напоминание об окончании подписки: одно на подписку и дату окончания,
+    чтобы повторный запуск рассылки не отправлял письмо второй раз
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        # Захвачено воркером: письмо отправляется или отправка прервалась
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    subscription = models.ForeignKey(
+        Subscription,
+        on_delete=models.CASCADE,
+        related_name='expiry_reminders'
+    )
+    end_date = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'subscription_expiry_reminders'
+        verbose_name = 'Expiry Reminder'
+        verbose_name_plural = 'Expiry Reminders'
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['subscription', 'end_date'],
+                name='expiry_reminder_unique_end_date'
+            ),
+        ]
+        indexes = [
+            # Рассылка выбирает только неотправленные напоминания
+            models.Index(
+                fields=['status'],
+                name='expiry_reminders_unsent_idx',
+                condition=~models.Q(status='sent'),
+            ),
+        ]
+
+    def __str__(self):
+        return f"Reminder for subscription {self.subscription_id} ({self.status})"
@@ -7,6 +7,7 @@ from .models import (
     PinnedPost, 
     SubscriptionHistory
 )
+from .services import EntitlementService
 
 
 class SubscriptionPlanSerializer(serializers.ModelSerializer):
@@ -63,7 +64,7 @@ class SubscriptionCreateSerializer(serializers.ModelSerializer):
     def validate(self, attrs):
         user = self.context['request'].user
 
-        if hasattr(user, 'subscription') and user.subscription.is_active:
+        if EntitlementService.get(user).is_active:
             raise serializers.ValidationError({
                 'non_field_errors': ['subscription is already active']
                 })
@@ -92,7 +93,7 @@ class PinnedPostSerializer(serializers.ModelSerializer):
                 'title': obj.post.title,
                 'slug': obj.post.slug,
                 'content': obj.post.content,
-                'image': obj.post.image, 
+                'image': obj.post.image.url if obj.post.image else None,
                 'views_count': obj.post.views_count,
                 'created_at': obj.post.created_at,
             }
@@ -111,7 +112,7 @@ class PinnedPostSerializer(serializers.ModelSerializer):
     def validate(self, attrs):
         user = self.context['request'].user
 
-        if not hasattr(user, 'subscription') or not user.subscription.is_active:
+        if not EntitlementService.get(user).can_pin_posts:
             raise serializers.ValidationError({
                 'non_field_errors': ['You must have an active subscription to pin posts.']
             })
@@ -138,17 +139,20 @@ class UserSubscriptionStatusSerializer(serializers.Serializer):
             
     def to_representation(self, instance):
         user = instance
-        has_subscription = hasattr(user, 'subscription')
-        subscription = user.subscription if has_subscription else None
-        is_active = subscription.is_active if subscription else False
-        pinned_post = getattr(user, 'pinned_post', None) if is_active else None
+        entitlement = EntitlementService.get(user)
+        # Строка подписки нужна только для полного описания, сами права берем из кэша
+        subscription = (
+            Subscription.objects.select_related('plan', 'user').filter(user=user).first()
+            if entitlement.has_subscription else None
+        )
+        pinned_post = getattr(user, 'pinned_post', None) if entitlement.is_active else None
 
         return {
-            'has_subscription': has_subscription,
-            'is_active': is_active,
+            'has_subscription': entitlement.has_subscription,
+            'is_active': entitlement.is_active,
             'subscription': SubscriptionSerializer(subscription).data if subscription else None,
             'pinned_post': PinnedPostSerializer(pinned_post).data if pinned_post else None,
-            'can_pin_posts': is_active,
+            'can_pin_posts': entitlement.can_pin_posts,
         }
     
 class PinPostSerializer(serializers.Serializer):
@@ -170,7 +174,7 @@ class PinPostSerializer(serializers.Serializer):
     
     def validate(self, attrs):
         user = self.context['request'].user
-        if not hasattr(user, 'subscription') or not user.subscription.is_active:
+        if not EntitlementService.get(user).can_pin_posts:
             raise serializers.ValidationError({
                 'non_field_errors': ['You must have an active subscription to pin posts.']
             })
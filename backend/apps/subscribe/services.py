@@ -0,0 +1,356 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ExpiryReminder, PinnedPost, Subscription, SubscriptionHistory
+
+logger = logging.getLogger(__name__)
+
+
+class Entitlement:
+    """Права пользователя по подписке: то, что проверяют views и сериализаторы"""
+
+    def __init__(self, has_subscription=False, status=None, plan_id=None,
+                 plan_name=None, features=None, end_date=None):
+        self.has_subscription = has_subscription
+        self.status = status
+        self.plan_id = plan_id
+        self.plan_name = plan_name
+        self.features = features or {}
+        self.end_date = end_date
+
+    @property
+    def is_active(self):
+        return (
+            self.status == 'active' and
+            self.end_date is not None and
+            self.end_date > timezone.now()
+        )
+
+    @property
+    def can_pin_posts(self):
+        return self.is_active
+
+    def to_dict(self):
+        return {
+            'has_subscription': self.has_subscription,
+            'status': self.status,
+            'plan_id': self.plan_id,
+            'plan_name': self.plan_name,
+            'features': self.features,
+            'end_date': self.end_date,
+        }
+
+
+class EntitlementService:
+    """
+    Кэш прав пользователя по подписке.
+    TTL заканчивается в end_date активной подписки, запись сбрасывается
+    при сохранении/удалении подписки и изменении плана. В пределах
+    запроса права запоминаются на объекте пользователя.
+    """
+    CACHE_KEY = 'entitlements:user:{user_id}'
+    MAX_TIMEOUT = 3600
+
+    @staticmethod
+    def cache_key(user_id) -> str:
+        return EntitlementService.CACHE_KEY.format(user_id=user_id)
+
+    @staticmethod
+    def get(user) -> Entitlement:
+        if user is None or not user.is_authenticated:
+            return Entitlement()
+
+        entitlement = getattr(user, '_entitlement', None)
+        if entitlement is not None:
+            return entitlement
+
+        data = cache.get(EntitlementService.cache_key(user.pk))
+        if data is None:
+            data = EntitlementService.refresh(user.pk)
+
+        entitlement = Entitlement(**data)
+        user._entitlement = entitlement
+        return entitlement
+
+    @staticmethod
+    def refresh(user_id) -> dict:
+        """Читает подписку из БД и кладет права в кэш"""
+        subscription = Subscription.objects.select_related('plan').filter(user_id=user_id).first()
+        if subscription is None:
+            entitlement = Entitlement()
+        else:
+            entitlement = Entitlement(
+                has_subscription=True,
+                status=subscription.status,
+                plan_id=subscription.plan_id,
+                plan_name=subscription.plan.name,
+                features=subscription.plan.features,
+                end_date=subscription.end_date,
+            )
+
+        timeout = EntitlementService.MAX_TIMEOUT
+        if entitlement.is_active:
+            remaining = (entitlement.end_date - timezone.now()).total_seconds()
+            timeout = min(timeout, remaining)
+
+        data = entitlement.to_dict()
+        cache.set(EntitlementService.cache_key(user_id), data, max(1, int(timeout)))
+        return data
+
+    @staticmethod
+    def invalidate(*user_ids):
+        """Сбрасывает права пользователей после коммита текущей транзакции"""
+        keys = [EntitlementService.cache_key(user_id) for user_id in user_ids]
+        if keys:
+            transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class SubscriptionExpiryService:
+    """
+    Пакетное истечение подписок без загрузки строк в Python:
+    UPDATE ... RETURNING по индексу (end_date, status), удаление закрепов
+    одним DELETE ... RETURNING и история через bulk_create.
+    Каждая пачка в своей транзакции, строки, заблокированные другими
+    транзакциями (например, продлением), пропускаются до следующего прохода.
+    """
+    BATCH_SIZE = 1000
+
+    EXPIRE_SQL = f"""
+        WITH due AS (
+            SELECT id FROM {Subscription._meta.db_table}
+            WHERE status = 'active' AND end_date <= %s
+            ORDER BY end_date
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE {Subscription._meta.db_table} AS subscription
+        SET status = 'expired', updated_at = %s
+        FROM due
+        WHERE subscription.id = due.id
+        RETURNING subscription.id, subscription.user_id
+    """
+
+    UNPIN_SQL = f"""
+        DELETE FROM {PinnedPost._meta.db_table} AS pin
+        USING {PinnedPost._meta.get_field('post').related_model._meta.db_table} AS post
+        WHERE pin.post_id = post.id AND pin.user_id = ANY(%s)
+        RETURNING pin.user_id, post.id, post.title
+    """
+
+    @staticmethod
+    def expire_batch(now, batch_size=None) -> tuple:
+        """Истекает одну пачку подписок, возвращает (подписок, снятых закрепов)"""
+        from apps.main.services import HomePageService
+
+        batch_size = batch_size or SubscriptionExpiryService.BATCH_SIZE
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(SubscriptionExpiryService.EXPIRE_SQL, [now, batch_size, now])
+            expired = dict((user_id, subscription_id) for subscription_id, user_id in cursor.fetchall())
+            if not expired:
+                return 0, 0
+
+            cursor.execute(SubscriptionExpiryService.UNPIN_SQL, [list(expired)])
+            unpinned = cursor.fetchall()
+
+            history = [
+                SubscriptionHistory(
+                    subscription_id=subscription_id,
+                    action='expired',
+                    description='Subscription has been expired',
+                    metadata={'old_status': 'active', 'new_status': 'expired'}
+                )
+                for subscription_id in expired.values()
+            ]
+            history += [
+                SubscriptionHistory(
+                    subscription_id=expired[user_id],
+                    action='post_unpinned',
+                    description=f'Post {post_title} has been unpinned',
+                    metadata={'post_id': post_id, 'post_title': post_title}
+                )
+                for user_id, post_id, post_title in unpinned
+            ]
+            SubscriptionHistory.objects.bulk_create(history)
+
+            EntitlementService.invalidate(*expired)
+            # Снятые закрепы были в снимке главной страницы
+            HomePageService.invalidate()
+
+        return len(expired), len(unpinned)
+
+    @staticmethod
+    def expire_due(now=None, batch_size=None) -> dict:
+        """Истекает все подписки с end_date <= now пачками"""
+        now = now or timezone.now()
+        batch_size = batch_size or SubscriptionExpiryService.BATCH_SIZE
+
+        expired_total = unpinned_total = 0
+        while True:
+            expired, unpinned = SubscriptionExpiryService.expire_batch(now, batch_size)
+            expired_total += expired
+            unpinned_total += unpinned
+            if expired < batch_size:
+                break
+
+        return {
+            'expired_subscriptions': expired_total,
+            'pinned_posts_removed': unpinned_total
+        }
+
+
+class ExpiryReminderService:
+    """
+    Напоминания об окончании подписки. Получатели фиксируются строками
+    ExpiryReminder (одна на подписку и дату окончания), письма уходят
+    пачками через одно SMTP-соединение на пачку, состояние каждого
+    письма сохраняется, поэтому повторный запуск не шлет письмо заново.
+    """
+    REMIND_BEFORE = timedelta(days=3)
+    CHUNK_SIZE = 100
+    MAX_ATTEMPTS = 3
+
+    @staticmethod
+    def schedule(now=None) -> list:
+        """
+        Создает напоминания для подписок, заканчивающихся в ближайшие
+        REMIND_BEFORE, и возвращает id неотправленных напоминаний
+        """
+        now = now or timezone.now()
+
+        due = Subscription.objects.filter(
+            status='active',
+            auto_renew=False,
+            end_date__gt=now,
+            end_date__lte=now + ExpiryReminderService.REMIND_BEFORE
+        ).values_list('id', 'end_date')
+        ExpiryReminder.objects.bulk_create(
+            [
+                ExpiryReminder(subscription_id=subscription_id, end_date=end_date)
+                for subscription_id, end_date in due
+            ],
+            ignore_conflicts=True
+        )
+
+        # Продленная подписка получит новое напоминание под новую дату
+        return list(
+            ExpiryReminder.objects.filter(
+                status__in=['pending', 'failed'],
+                attempts__lt=ExpiryReminderService.MAX_ATTEMPTS,
+                end_date__gt=now,
+                end_date=F('subscription__end_date'),
+                subscription__status='active',
+                subscription__auto_renew=False
+            ).order_by('id').values_list('id', flat=True)
+        )
+
+    @staticmethod
+    def chunks(reminder_ids, size=None) -> list:
+        size = size or ExpiryReminderService.CHUNK_SIZE
+        return [reminder_ids[i:i + size] for i in range(0, len(reminder_ids), size)]
+
+    @staticmethod
+    def build_message(reminder, connection) -> EmailMessage:
+        subscription = reminder.subscription
+        user = subscription.user
+        return EmailMessage(
+            subject='Your subscription is expiring soon',
+            body=f'Dear {user.get_full_name() or user.username}, \n\n'
+                 f'Your {subscription.plan.name} subscription will expire on {reminder.end_date.strftime("%B %d, %Y")}.\n\n'
+                 f'To continue enjoying premium features, please renew your subscription.\n\n'
+                 f'Best Regards, \nNews Site Team',
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[user.email],
+            connection=connection
+        )
+
+    @staticmethod
+    def claim(reminder_ids) -> list:
+        """
+        Забирает неотправленные напоминания пачки коротким коммитом:
+        строки переходят в sending, параллельный воркер и повторный запуск
+        их уже не выберут. Возвращает id захваченных напоминаний
+        """
+        with transaction.atomic():
+            claimed = list(
+                ExpiryReminder.objects.filter(
+                    id__in=reminder_ids,
+                    status__in=['pending', 'failed']
+                ).select_for_update(skip_locked=True).values_list('id', flat=True)
+            )
+            ExpiryReminder.objects.filter(id__in=claimed).update(
+                status='sending',
+                attempts=F('attempts') + 1,
+                updated_at=timezone.now()
+            )
+        return claimed
+
+    @staticmethod
+    def save_result(reminder_id, error=None):
+        """Результат отправки одного письма сохраняется сразу своим UPDATE"""
+        now = timezone.now()
+        if error is None:
+            changes = {'status': 'sent', 'error': '', 'sent_at': now}
+        else:
+            changes = {'status': 'failed', 'error': error}
+        ExpiryReminder.objects.filter(id=reminder_id, status='sending').update(updated_at=now, **changes)
+
+    @staticmethod
+    def send_chunk(reminder_ids) -> dict:
+        """
+        Отправляет пачку напоминаний через одно соединение вне транзакции.
+        Если пачка прервется, отправленные письма уже отмечены sent,
+        а письмо, отправка которого не завершилась, остается в sending
+        и повторно не отправляется
+        """
+        claimed = ExpiryReminderService.claim(reminder_ids)
+        if not claimed:
+            return {'sent': 0, 'failed': 0}
+
+        reminders = ExpiryReminder.objects.filter(id__in=claimed).select_related(
+            'subscription__user', 'subscription__plan'
+        ).order_by('id')
+
+        sent = failed = 0
+        mail_connection = get_connection()
+        try:
+            mail_connection.open()
+        except Exception as e:
+            # Соединение не открылось: вся пачка уйдет в следующий запуск
+            logger.warning(f"Failed to open mail connection: {e}")
+            ExpiryReminder.objects.filter(id__in=claimed, status='sending').update(
+                status='failed', error=str(e), updated_at=timezone.now()
+            )
+            return {'sent': 0, 'failed': len(claimed)}
+
+        attempted = set()
+        try:
+            for reminder in reminders:
+                attempted.add(reminder.id)
+                try:
+                    ExpiryReminderService.build_message(reminder, mail_connection).send()
+                except Exception as e:
+                    logger.warning(f"Failed to send the reminder {reminder.id}: {e}")
+                    ExpiryReminderService.save_result(reminder.id, error=str(e))
+                    failed += 1
+                else:
+                    ExpiryReminderService.save_result(reminder.id)
+                    sent += 1
+        finally:
+            mail_connection.close()
+            # Прерванная пачка (таймаут, остановка воркера) возвращает
+            # еще не начатые письма в очередь
+            untouched = set(claimed) - attempted
+            if untouched:
+                ExpiryReminder.objects.filter(id__in=untouched, status='sending').update(
+                    status='pending', attempts=F('attempts') - 1, updated_at=timezone.now()
+                )
+
+        return {'sent': sent, 'failed': failed}
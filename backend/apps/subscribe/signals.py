@@ -1,7 +1,17 @@
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import post_save, pre_delete, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
-from .models import Subscription, PinnedPost, SubscriptionHistory
+from . import history
+from .models import Subscription, SubscriptionPlan, PinnedPost
+from .services import EntitlementService
+
+# Действие в журнале для перехода подписки в статус
+STATUS_ACTIONS = {
+    'active': 'activated',
+    'pending': 'renewed',
+    'cancelled': 'cancelled',
+    'expired': 'expired',
+}
 
 @receiver(post_save, sender=Subscription)
 def subscription_post_save(sender, instance, created, **kwargs):
@@ -10,7 +20,7 @@ def subscription_post_save(sender, instance, created, **kwargs):
     """
     if created: 
         # Новая подписка
-        SubscriptionHistory.objects.create(
+        history.record(
             subscription=instance,
             action='created',
             description=f'Subscription created for a plan {instance.plan.name}',
@@ -20,11 +30,18 @@ def subscription_post_save(sender, instance, created, **kwargs):
         # Проверяем изменение статуса (если модель сохраняет прошлый статус)
         previous_status = getattr(instance, '_previous_status', None)
         if previous_status and previous_status != instance.status:
-            SubscriptionHistory.objects.create(
+            # Подробности перехода (платеж, причина) сервисы передают через _history_note
+            note = getattr(instance, '_history_note', None) or {}
+            history.record(
                 subscription=instance,
-                action=instance.status,
-                description=f'Subscription status changed from {instance._previous_status} to {instance.status}',
-                metadata={'old_status': previous_status, 'new_status=': instance.status}
+                action=STATUS_ACTIONS.get(instance.status, instance.status),
+                description=note.get('description') or
+                    f'Subscription status changed from {previous_status} to {instance.status}',
+                metadata={
+                    'old_status': previous_status,
+                    'new_status': instance.status,
+                    **note.get('metadata', {})
+                }
             )
         
 @receiver(post_save, sender=PinnedPost)
@@ -34,16 +51,18 @@ def pinned_post_post_save(sender, instance, created, **kwargs):
     Если подписка неактивна, удаляет закреп.
     """
     user = instance.user
+    subscription = getattr(user, 'subscription', None)
 
     # Если новый pinned post, но подписка неактивна - удаляем
     if created:
-        subscription = getattr(user, 'subscription', None)
         if not subscription or not getattr(subscription, 'is_active', None):
             instance.delete()
             return  
+    elif not subscription:
+        return
     
     # Записываем в историю
-    SubscriptionHistory.objects.create(
+    history.record(
         subscription=subscription,
         action='post_pinned',
         description=f'Post {instance.post.title} pinned',
@@ -60,7 +79,7 @@ def pinned_post_pre_delete(sender, instance, **kwargs):
     """
     subscription = getattr(instance.user, 'subscription', None)
     if subscription:
-        SubscriptionHistory.objects.create(
+        history.record(
             subscription=subscription,
             action='post_unpinned',
             description=f'Post {instance.post.title} has been unpinned',
@@ -70,8 +89,40 @@ def pinned_post_pre_delete(sender, instance, **kwargs):
             }
         )
 
-    # Убираем связь pinned post, если есть
-    if hasattr(instance.user, 'pinned_post'):
-        instance.user.pinned_post = None,
-        instance.user.save(update_fields=['pinned_post'])
+@receiver(post_save, sender=Subscription)
+def sync_pinned_post_activity(sender, instance, **kwargs):
+    """Закреп пользователя активен до конца его активной подписки"""
+    PinnedPost.objects.filter(user_id=instance.user_id).update(
+        active_until=instance.end_date if instance.status == 'active' else None
+    )
+
+
+@receiver(post_save, sender=PinnedPost)
+@receiver(post_delete, sender=PinnedPost)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_home_page_pins(sender, **kwargs):
+    """Закрепленные посты входят в снимок главной страницы"""
+    from apps.main.services import HomePageService
+    HomePageService.invalidate()
 
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_subscription_entitlement(sender, instance, **kwargs):
+    """Сбрасывает кэш прав пользователя при изменении его подписки"""
+    EntitlementService.invalidate(instance.user_id)
+    # Права, запомненные на загруженном пользователе, тоже устарели
+    user = instance._state.fields_cache.get('user')
+    if user is not None:
+        user.__dict__.pop('_entitlement', None)
+
+
+@receiver(post_save, sender=SubscriptionPlan)
+def invalidate_plan_entitlements(sender, instance, created, **kwargs):
+    """Возможности плана входят в права пользователей на этом плане"""
+    if created:
+        return
+    user_ids = Subscription.objects.filter(plan=instance).values_list('user_id', flat=True)
+    EntitlementService.invalidate(*user_ids)
@@ -1,73 +1,28 @@
-from celery import shared_task
-from django.utils import timezone
-from .models import Subscription, PinnedPost, SubscriptionHistory
+from celery import group, shared_task
+from apps.partitions import maintain_partitions
+from .services import ExpiryReminderService, SubscriptionExpiryService
 
 @shared_task
 def check_expired_subscriptions():
     """Периодическая проверка для истекших подписок"""
-    now = timezone.now()
-
-    expired_subscriptions = Subscription.objects.filter(
-        status='Active',
-        timezone_now__lt = now,
-    )
-
-    expired_count = 0
-    pinned_post_removed = 0
-
-    for subscription in expired_subscriptions:
-        subscription.delete()
-        expired_count += 1
-        # Удаляем закрепленный пост если есть
-        try:
-            pinned_post = subscription.user.pinned_post
-            pinned_post.delete()
-            pinned_post_removed += 1
-        except PinnedPost.DoesNotExist:
-            pass
-        #Записываем в историю
-        SubscriptionHistory.objects.create(
-            subscription=subscription,
-            action='expired',
-            description='Subscription has been expired'
-        )
-    
-    return {
-        'expired_subscriptions': expired_count,
-        'pinned_posts_removed': pinned_post_removed
-    }
+    return SubscriptionExpiryService.expire_due()
 
 @shared_task
 def send_subscription_expiry_reminder():
-    from datetime import timedelta
-    from django.core.mail import send_mail
-    from django.conf import settings
+    """Ежедневная рассылка напоминаний: пачки отправляются параллельными подзадачами"""
+    reminder_ids = ExpiryReminderService.schedule()
+    chunks = ExpiryReminderService.chunks(reminder_ids)
+    if chunks:
+        group(send_expiry_reminder_chunk.s(chunk) for chunk in chunks).apply_async()
 
-    reminder_date = timezone.now() + timedelta(days=3)
+    return {'reminders_queued': len(reminder_ids), 'chunks': len(chunks)}
 
-    expiring_subscriptions = Subscription.objects.filter(
-        status='active',
-        end_date__date=reminder_date.date(),
-        auto_renew=False
-    )
-
-    sent_count = 0 
+@shared_task
+def send_expiry_reminder_chunk(reminder_ids):
+    """Отправка одной пачки напоминаний через одно соединение с почтовым сервером"""
+    return ExpiryReminderService.send_chunk(reminder_ids)
 
-    for subscription in expiring_subscriptions:
-        try:
-            send_mail(
-                subject='Your subscription is expiring soon',
-                message=f'Dear {subscription.user.get_full_name() or subscription.user.username}, \n\n'
-                        f'Your {subscription.plan.name} subscription will expire on {subscription.end_date.strftime("%B %d, %Y")}.\n\n'
-                        f'To continue enjoying premium features, please renew your subscription.\n\n'
-                        f'Best Regards, \nNews Site Team',
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipent_list=[subscription.user.email],
-                fail_silently=True
-            )
-            sent_count += 1
-        except Exception as e:
-            print(f'Failed to send the reminder to {subscription.user.email}: {e}')
-        
-    return {'reminder_sent': sent_count}
-            
\ No newline at end of file
+@shared_task
+def cleanup_old_subscription_history():
+    """Очистка журнала подписок: удаляются месячные секции старше срока хранения"""
+    return maintain_partitions('subscription_history')
@@ -5,8 +5,10 @@ from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.db import transaction
 from django.utils import timezone
+from django.db.models import Count, Max, Q
 
 from .models import SubscriptionPlan, Subscription, PinnedPost, SubscriptionHistory
+from .services import EntitlementService
 from .serializers import (
     SubscriptionPlanSerializer, 
     SubscriptionSerializer, 
@@ -17,6 +19,8 @@ from .serializers import (
     UnpinPostSerializer
 )
 from apps.main.models import Post
+from apps.main.conditional import make_etag, not_modified_response, set_conditional_headers
+from config.images import image_srcset
 
 
 class SubscriptionPlanListView(generics.ListAPIView):
@@ -24,6 +28,20 @@ class SubscriptionPlanListView(generics.ListAPIView):
     serializer_class = SubscriptionPlanSerializer
     permission_classes = [permissions.AllowAny]
 
+    def list(self, request, *args, **kwargs):
+        # Дата по всем планам: отключение плана тоже меняет список
+        plans = SubscriptionPlan.objects.aggregate(
+            active=Count('id', filter=Q(is_active=True)),
+            last_modified=Max('updated_at')
+        )
+        etag = make_etag(request.get_full_path(), plans['active'], plans['last_modified'])
+        response = not_modified_response(request, etag, plans['last_modified'])
+        if response is not None:
+            return response
+
+        response = super().list(request, *args, **kwargs)
+        return set_conditional_headers(response, etag, plans['last_modified'])
+
 class SubscriptionPlanDetailView(generics.RetrieveAPIView):
     queryset = SubscriptionPlan.objects.filter(is_active=True)
     serializer_class = SubscriptionPlanSerializer
@@ -82,7 +100,7 @@ class PinnedPostView(generics.RetrieveUpdateDestroyAPIView):
             }, status=status.HTTP_404_NOT_FOUND)
         
     def update(self, request, *args, **kwargs):
-        if not hasattr(request.user, 'subscription') or not request.user.subscription.is_active:
+        if not EntitlementService.get(request.user).can_pin_posts:
             return Response({
                 'error': 'Active subscription required to pin posts'
             }, status=status.HTTP_403_FORBIDDEN)
@@ -125,7 +143,7 @@ def pin_post(request):
                     }, status=status.HTTP_403_FORBIDDEN)                
 
                 #проверяем подписку
-                if not hasattr(request.user, 'subscription') or not request.user.subscription.is_active:
+                if not EntitlementService.get(request.user).can_pin_posts:
                     return Response({
                         'error': 'Active subscsription is needed to be able to pin posts'
                     }, status=status.HTTP_403_FORBIDDEN)
@@ -179,17 +197,12 @@ def cancel_subscription(request):
             }, status=status.HTTP_404_NOT_FOUND)
         
         with transaction.atomic():
+            subscription._history_note = {'description': 'Subscription has been cancelled by user'}
             subscription.cancel()
 
             if hasattr(request.user, 'pinned_post'):
                 request.user.pinned_post.delete()
 
-            SubscriptionHistory.objects.create(
-                subscription=subscription,
-                action='cancelled',
-                description='Subscription has been cancelled by user'
-            )
-
             return Response({
                 'message': 'Subscription cancelled successfully'
             }, status=status.HTTP_200_OK)
@@ -203,10 +216,11 @@ def cancel_subscription(request):
 @permission_classes([permissions.AllowAny])
 def pinned_posts_list(request):
     pinned_posts = PinnedPost.objects.select_related(
-        'post', 'post__author', 'post__category', 'user__subscription'
+        'post', 'post__author', 'post__category'
+    ).defer(
+        'post__content', 'post__search_vector'
     ).filter(
-        user__subscription__status='active',
-        user__subscription__end_date__gt=timezone.now(),
+        active_until__gt=timezone.now(),
         post__status='published'
     ).order_by('-pinned_at')
 
@@ -217,8 +231,9 @@ def pinned_posts_list(request):
             'id': post.id,
             'title': post.title,
             'slug': post.slug,
-            'content': post.content[:200] + '...' if len(post.content) > 200 else post.content,
+            'content': post.excerpt,
             'image': post.image.url if post.image else None,
+            'image_srcset': image_srcset(post.image_variants, request),
             'category': post.category.name if post.category else None,
             'author': {
                 'id': post.author.id,
@@ -242,17 +257,16 @@ def can_pin_post(request, post_id):
     try:
         post = get_object_or_404(Post, id=post_id, status='published')
 
+        entitlement = EntitlementService.get(request.user)
+
         #Проверки
         checks = {
             'post_exists': True,
-            'is_own_post': post.author == request.user,
-            'has_subscription': hasattr(request.user, 'subscription'),
-            'subscription_active': False, 
+            'is_own_post': post.author_id == request.user.id,
+            'has_subscription': entitlement.has_subscription,
+            'subscription_active': entitlement.is_active, 
             'can_pin': False
         }
-        
-        if checks['has_subscription']:
-            checks['subscription_active'] = request.user.subscription.is_active
 
         checks['can_pin'] = (
             checks['is_own_post'] and
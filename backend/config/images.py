@@ -0,0 +1,119 @@
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+
+# Размеры производных изображений: вписываются в рамку, без увеличения
+IMAGE_VARIANTS = {
+    'thumbnail': (320, 320),
+    'card': (800, 800),
+    'full': (1600, 1600),
+}
+
+# Форматы: (расширение, формат Pillow, параметры сохранения)
+IMAGE_FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+
+def _flatten(image):
+    """JPEG не поддерживает прозрачность: кладем изображение на белый фон"""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def build_image_variants(name, storage=default_storage):
+    """
+    Строит производные изображения для файла name и сохраняет их рядом
+    в подкаталоге variants/. Ориентация из EXIF применяется к пикселям,
+    сами метаданные (EXIF, GPS) в производные не попадают.
+
+    Возвращает {'card': {'width': ..., 'height': ..., 'webp': name, 'jpg': name}, ...}
+    """
+    with storage.open(name, 'rb') as source:
+        original = Image.open(source)
+        original.load()
+
+    original = ImageOps.exif_transpose(original)
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+
+    variants = {}
+    for variant, size in IMAGE_VARIANTS.items():
+        image = original.copy()
+        image.thumbnail(size, Image.Resampling.LANCZOS)
+
+        entry = {'width': image.width, 'height': image.height}
+        for extension, image_format, options in IMAGE_FORMATS:
+            rendered = image if image_format == 'WEBP' else _flatten(image)
+            buffer = BytesIO()
+            rendered.save(buffer, format=image_format, **options)
+            path = os.path.join(directory, 'variants', f'{stem}-{variant}.{extension}')
+            entry[extension] = storage.save(path, ContentFile(buffer.getvalue()))
+        variants[variant] = entry
+
+    return variants
+
+
+def loaded_file_name(instance, field):
+    """
+    Имя файла в поле модели, не обращаясь к БД.
+    None, если поле отложено (defer/only) и не загружено
+    """
+    if field not in instance.__dict__:
+        return None
+    value = instance.__dict__[field]
+    return (getattr(value, 'name', value) or '') if value else ''
+
+
+def variant_file_names(variants):
+    """Имена всех файлов производных изображений"""
+    return [
+        value
+        for entry in (variants or {}).values()
+        for key, value in entry.items()
+        if key not in ('width', 'height')
+    ]
+
+
+def delete_image_variants(names, storage=default_storage):
+    for name in names:
+        try:
+            storage.delete(name)
+        except OSError as e:
+            logger.warning(f"Failed to delete image variant {name}: {e}")
+
+
+def image_srcset(variants, request=None, storage=default_storage):
+    """
+    Карта для srcset: {'card': {'width': 800, 'height': 600, 'webp': url, 'jpg': url}, ...}.
+    Пока производные не построены, возвращает None
+    """
+    if not variants:
+        return None
+
+    srcset = {}
+    for variant, entry in variants.items():
+        urls = {}
+        for key, value in entry.items():
+            if key in ('width', 'height'):
+                urls[key] = value
+                continue
+            url = storage.url(value)
+            urls[key] = request.build_absolute_uri(url) if request else url
+        srcset[variant] = urls
+    return srcset
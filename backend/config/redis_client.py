@@ -0,0 +1,13 @@
+import redis
+from django.conf import settings
+
+
+_connection = None
+
+
+def get_redis_connection():
+    """Возвращает общее подключение к Redis (один пул соединений на процесс)"""
+    global _connection
+    if _connection is None:
+        _connection = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _connection
@@ -17,6 +17,7 @@ DJANGO_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 ]
 
 THIRD_PARTY_APPS = [
@@ -205,6 +206,13 @@ FRONTEND_URL = config('FRONTEND_URL', default='http://localhost:5173')
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
 STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET', default='')
+# HTTP-клиент Stripe: адрес API (можно указать локальную заглушку stripe_stub_server),
+# таймауты в секундах, повторы сетевых ошибок и размер пула соединений
+STRIPE_API_BASE = config('STRIPE_API_BASE', default='https://api.stripe.com')
+STRIPE_CONNECT_TIMEOUT = config('STRIPE_CONNECT_TIMEOUT', default=3.0, cast=float)
+STRIPE_READ_TIMEOUT = config('STRIPE_READ_TIMEOUT', default=20.0, cast=float)
+STRIPE_MAX_NETWORK_RETRIES = config('STRIPE_MAX_NETWORK_RETRIES', default=2, cast=int)
+STRIPE_POOL_SIZE = config('STRIPE_POOL_SIZE', default=20, cast=int)
 
 # Email настройки (для уведомлений)
 EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
@@ -223,6 +231,24 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_ACCEPT_CONTENT = ['json']
 
+# Redis для счетчиков и буферов (отдельная база от брокера Celery)
+REDIS_URL = config('REDIS_URL', default='redis://localhost:6379/1')
+
+# Кэш (материализованные наборы, снапшоты страниц)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('CACHE_URL', default='redis://localhost:6379/2'),
+        'KEY_PREFIX': 'newssite',
+    }
+}
+
+# Журналы секционированы по месяцам: секции создаются заранее,
+# устаревшие удаляются целиком (сроки хранения в месяцах)
+PARTITION_MONTHS_AHEAD = config('PARTITION_MONTHS_AHEAD', default=3, cast=int)
+SUBSCRIPTION_HISTORY_RETENTION_MONTHS = config('SUBSCRIPTION_HISTORY_RETENTION_MONTHS', default=24, cast=int)
+WEBHOOK_EVENTS_RETENTION_MONTHS = config('WEBHOOK_EVENTS_RETENTION_MONTHS', default=3, cast=int)
+
 # Celery Beat настройки для периодических задач
 CELERY_BEAT_SCHEDULE = {
     'check-expired-subscriptions': {
@@ -237,12 +263,32 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'apps.payment.tasks.cleanup_old_payments',
         'schedule': 604800.0,  # Каждую неделю
     },
+    'reconcile-checkout-payments': {
+        'task': 'apps.payment.tasks.reconcile_checkout_payments',
+        'schedule': 600.0,  # Каждые 10 минут
+    },
     'cleanup-old-webhook-events': {
-        'task': 'apps.payment.tasks.cleanup_old_webhook_events',
+        'task': 'apps.payment.tasks.cleanup_old_webhooks',
         'schedule': 86400.0,  # Каждый день
     },
+    'cleanup-old-subscription-history': {
+        'task': 'apps.subscribe.tasks.cleanup_old_subscription_history',
+        'schedule': 86400.0,  # Каждый день
+    },
+    'process-pending-webhook-events': {
+        'task': 'apps.payment.tasks.process_pending_webhook_events',
+        'schedule': 60.0,  # Каждую минуту
+    },
     'retry-failed-webhook-events': {
         'task': 'apps.payment.tasks.retry_failed_webhook_events',
-        'schedule': 3600.0,  # Каждый час
+        'schedule': 60.0,  # Каждую минуту, задержку задает next_retry_at
+    },
+    'flush-post-views': {
+        'task': 'apps.main.tasks.flush_post_views',
+        'schedule': 60.0,  # Каждую минуту
+    },
+    'update-trending-scores': {
+        'task': 'apps.main.tasks.update_trending_scores',
+        'schedule': 300.0,  # Каждые 5 минут
     },
 }
\ No newline at end of file